@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from wechatv3.message_rules import MessageRules
+
+
+def _msg(content, sender='仓库'):
+    return SimpleNamespace(content=content, sender=sender)
+
+
+def test_overlapping_keywords_from_different_rules():
+    rules = MessageRules([
+        {"pattern": r"FHD\d{8}", "types": {"退货": "退货"}, "default_type": "发货单"},
+        {"pattern": r"THD\d{8}", "types": {"退货单": "退货单"}, "default_type": "退货"},
+    ])
+    items = rules.classify([_msg("退货单 FHD12345678"), _msg("退货单 THD12345678")])
+    assert [(item.invoice_id, item.doc_type) for item in items] == [
+        ("FHD12345678", "退货"), ("THD12345678", "退货单")]
+
+
+def test_keyword_inside_longer_keyword():
+    rules = MessageRules([
+        {"pattern": r"FHD\d{8}", "types": {"货单": "货单", "退货": "退货"}, "default_type": "发货单"},
+        {"pattern": r"THD\d{8}", "types": {"退货单": "退货单"}, "default_type": "退货"},
+    ])
+    items = rules.classify([_msg("FHD12345678 退货单"), _msg("FHD87654321")])
+    assert [(item.invoice_id, item.doc_type) for item in items] == [
+        ("FHD12345678", "货单"), ("FHD87654321", "发货单")]
@@ -0,0 +1,39 @@
+import time
+
+
+class AdaptivePoller:
+    """
+    根据是否有新消息调整的轮询间隔
+
+    收到消息后间隔回到最小值，连续发单时能很快取到后面的消息；
+    没有消息时每次放大 growth 倍，直到最大值，空闲时减少界面扫描的次数。
+    """
+
+    def __init__(self, min_interval: float = 0.5, max_interval: float = 5, growth: float = 1.5):
+        """
+        :param min_interval: 收到消息后的轮询间隔（秒）
+        :param max_interval: 空闲时的轮询间隔上限（秒）
+        :param growth: 没有消息时间隔放大的倍数
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.growth = max(growth, 1.0)
+        self.interval = self.min_interval
+        self.last_poll_at = time.monotonic()
+
+    def polled(self, found: int) -> float:
+        """
+        一次轮询结束，返回下一次的间隔
+
+        :param found: 这次收到的消息数
+        """
+        self.last_poll_at = time.monotonic()
+        if found:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.growth, self.max_interval)
+        return self.interval
+
+    def wait(self) -> None:
+        """等待到下一次轮询"""
+        time.sleep(self.interval)
@@ -0,0 +1,176 @@
+import glob
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import cv2
+import numpy as np
+import yaml
+
+from wechatv3.common import get_config, AppConfig
+from wechatv3.logger_config import LoggerManager
+from wechatv3.template_matcher import TemplateMatcher, get_matcher
+from wechatv3.template_registry import get_template_registry
+
+logger = LoggerManager().get_logger()
+
+
+@dataclass
+class Calibration:
+    """一个模板在一种颜色模式下的标定结果"""
+    key: str
+    grayscale: bool
+    present: list[float] = field(default_factory=list)  # 含有模板的截图上能匹配到的最高阈值
+    absent: list[float] = field(default_factory=list)  # 不含模板的截图上能匹配到的最高阈值
+
+    @property
+    def gap(self) -> float:
+        """最难识别的正样本与最容易误识别的负样本之间的距离，小于 0 表示无法区分"""
+        return min(self.present) - (max(self.absent) if self.absent else 0.0)
+
+    def threshold(self, margin: float, min_confidence: float, precision: float) -> float | None:
+        """
+        选择的阈值，向下取到 0.01
+
+        有负样本时取正负样本中间，没有负样本时比最难识别的正样本低 margin，
+        负样本太少时中间值可能很低，不低于 min_confidence（除非正样本本身就低于它）。
+        负样本的最高阈值有 precision 的误差，阈值必须比它再高 precision，
+        取整后落到这以下时向上取到 0.01，仍然不高于最难识别的正样本时返回 None
+        """
+        lowest_present = min(self.present)
+        if self.absent:
+            value = (lowest_present + max(self.absent)) / 2
+        else:
+            value = lowest_present - margin
+        value = min(max(value, min_confidence), lowest_present)
+        value = float(np.floor(round(value * 100, 6)) / 100)
+        if self.absent:
+            floor = max(self.absent) + precision
+            if value <= floor:
+                # 高于 floor 的最小的 0.01 的倍数
+                value = float((np.floor(round(floor * 100, 6)) + 1) / 100)
+                # 比 floor 高一点的阈值可能超过最难识别的正样本
+                if value > lowest_present:
+                    return None
+        return value
+
+
+class ConfidenceCalibrator:
+    """
+    根据录制的截图标定每个模板的匹配阈值和是否使用灰度
+
+    截图目录结构: <目录>/<模板名称>/present/*.png 含有该模板，<目录>/<模板名称>/absent/*.png 不含该模板。
+    每张截图用运行时相同的匹配引擎求出仍能匹配到的最高阈值，
+    阈值取在正负样本之间，颜色模式选区分度大的，两种都能区分时优先使用更快的灰度。
+    """
+
+    def __init__(self, corpus_dir: str, margin: float = 0.03, min_confidence: float = 0.7, min_gap: float = 0.05,
+                 precision: float = 0.005):
+        """
+        :param corpus_dir: 截图目录
+        :param margin: 没有负样本时阈值比最难识别的正样本低多少
+        :param min_confidence: 阈值下限
+        :param min_gap: 灰度模式的区分度至少为这个值才使用灰度
+        :param precision: 求最高阈值的精度
+        """
+        self.corpus_dir = corpus_dir
+        self.margin = margin
+        self.min_confidence = min_confidence
+        self.min_gap = min_gap
+        self.precision = precision
+        self.templates = get_template_registry()
+
+    @staticmethod
+    def _read(path: str) -> np.ndarray:
+        return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def _max_confidence(self, matcher: TemplateMatcher, haystack: np.ndarray, needle: np.ndarray) -> float:
+        """二分求出 locate 仍能找到模板的最高阈值，找不到时为 0"""
+        low, high = 0.0, 1.0
+        if matcher.locate(haystack, needle, 0.5) is not None:
+            low = 0.5
+        else:
+            high = 0.5
+        while high - low > self.precision:
+            middle = (low + high) / 2
+            if matcher.locate(haystack, needle, middle) is not None:
+                low = middle
+            else:
+                high = middle
+        return round(low, 3)
+
+    def calibrate_key(self, key: str) -> list[Calibration]:
+        """标定一个模板，返回彩色和灰度两种模式的结果"""
+        matcher = get_matcher(key)
+        results = [Calibration(key, False), Calibration(key, True)]
+        for label in ('present', 'absent'):
+            for path in sorted(glob.glob(os.path.join(self.corpus_dir, key, label, '*.png'))):
+                frame = self._read(path)
+                gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                for result in results:
+                    haystack = gray_frame if result.grayscale else frame
+                    needle = self.templates.get(key, grayscale=result.grayscale)
+                    getattr(result, label).append(self._max_confidence(matcher, haystack, needle))
+        return results
+
+    def choose(self, results: list[Calibration]) -> Calibration | None:
+        color, gray = results
+        if not color.present:
+            return None
+        # 没有负样本时无法判断灰度会不会误识别，保持彩色
+        if not color.absent:
+            return color
+        if gray.gap >= self.min_gap:
+            return gray
+        return max(results, key=lambda result: result.gap)
+
+    def run(self) -> dict:
+        """标定截图目录中所有已配置的模板，返回 {模板名称: {confidence, grayscale}}"""
+        thresholds = {}
+        for key in sorted(os.listdir(self.corpus_dir)):
+            if not os.path.isdir(os.path.join(self.corpus_dir, key)):
+                continue
+            if key not in self.templates:
+                logger.warning(f"跳过未配置的模板: {key}")
+                continue
+            results = self.calibrate_key(key)
+            for result in results:
+                logger.info(f"{key} {'灰度' if result.grayscale else '彩色'}: "
+                            f"正样本 {result.present}，负样本 {result.absent}")
+            chosen = self.choose(results)
+            if chosen is None:
+                logger.warning(f"{key} 没有正样本，无法标定")
+                continue
+            if chosen.gap < 0:
+                # 任何阈值都会误识别，不写入标定结果，匹配时仍使用默认的 confidence
+                logger.warning(f"{key} 的正负样本无法区分 (区分度 {chosen.gap:.3f})，不写入阈值，"
+                               f"请检查模板图片或截图标注")
+                continue
+            confidence = chosen.threshold(self.margin, self.min_confidence, self.precision)
+            if confidence is None:
+                logger.warning(f"{key} 的正负样本太接近 (区分度 {chosen.gap:.3f})，取整后的阈值无法区分，不写入阈值，"
+                               f"请检查模板图片或截图标注")
+                continue
+            thresholds[key] = {'confidence': confidence, 'grayscale': chosen.grayscale}
+            logger.info(f"{key} 标定结果: {thresholds[key]}")
+        return thresholds
+
+    @staticmethod
+    def save(thresholds: dict, output: str) -> None:
+        header = (f"# 由 python -m wechatv3.calibrate 生成于 {datetime.now():%Y-%m-%d %H:%M:%S}，请勿手动修改\n"
+                  f"# 需要手动指定的阈值写在 config.yaml 的 match.thresholds 中，优先级高于此文件\n")
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(header)
+            yaml.safe_dump({'thresholds': thresholds}, f, allow_unicode=True, sort_keys=True)
+
+
+if __name__ == '__main__':
+    # 标定模板阈值: python -m wechatv3.calibrate <截图目录> [输出路径]
+    import sys
+
+    calibration_output = sys.argv[2] if len(sys.argv) > 2 else get_config().match.get('calibration')
+    if not os.path.isabs(calibration_output):
+        calibration_output = os.path.join(AppConfig.base_dir, calibration_output)
+    calibrated = ConfidenceCalibrator(sys.argv[1]).run()
+    ConfidenceCalibrator.save(calibrated, calibration_output)
+    logger.info(f"已标定 {len(calibrated)} 个模板，保存到: {calibration_output}")
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class ChatWatermarks:
+    """
+    每个聊天最后看到的消息位置
+
+    微信消息没有跨会话不变的编号，用 发送人+内容 的哈希标记消息，同时记录看到的时间方便查看。
+    "收到"、"好的" 这类消息经常重复，所以位置记录最后 FINGERPRINT_SIZE 条消息的标记，
+    启动加载历史消息时遇到整段相同的消息才停止，不需要在聊天中查找最后处理的单号。
+    """
+
+    FINGERPRINT_SIZE = 5
+
+    def __init__(self, watermark_file: str):
+        self.watermark_file = watermark_file
+        self._lock = threading.Lock()
+        self._marks: dict[str, dict] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.watermark_file):
+            return
+        try:
+            with open(self.watermark_file, 'r', encoding='utf-8') as f:
+                self._marks = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取历史消息位置失败，按最后处理的单号加载历史消息: {e}")
+
+    @staticmethod
+    def key(msg) -> str:
+        """消息的标记"""
+        return hashlib.sha1(f"{msg.sender}\0{msg.content}".encode('utf-8')).hexdigest()[:16]
+
+    def get(self, chat: str) -> list[str]:
+        """聊天最后看到的几条消息的标记，从旧到新；没有记录时返回空列表"""
+        # 旧版本只记录一条消息的 'key'，无法区分重复消息，不再使用
+        return list(self._marks.get(chat, {}).get('keys', []))
+
+    def locate(self, chat: str, msgs: list) -> int:
+        """
+        在从旧到新的消息中查找最后看到的位置
+
+        :return: 与记录的整段消息相同的最新位置中最后一条消息的下标，没有找到时返回 -1
+        """
+        keys = self.get(chat)
+        if not keys:
+            return -1
+        msg_keys = [self.key(msg) for msg in msgs]
+        for end in range(len(msg_keys) - 1, len(keys) - 2, -1):
+            if msg_keys[end - len(keys) + 1:end + 1] == keys:
+                return end
+        return -1
+
+    def _update(self, chat: str, keys: list[str]) -> None:
+        keys = keys[-self.FINGERPRINT_SIZE:]
+        with self._lock:
+            if self.get(chat) != keys:
+                self._marks[chat] = {'keys': keys, 'seen_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+                self._dirty = True
+
+    def set(self, chat: str, msgs: list) -> None:
+        """记录聊天最后看到的消息，msgs 为聊天中最新的几条消息，从旧到新"""
+        self._update(chat, [self.key(msg) for msg in msgs])
+
+    def extend(self, chat: str, msgs: list) -> None:
+        """在已记录的位置之后追加新收到的消息"""
+        self._update(chat, self.get(chat) + [self.key(msg) for msg in msgs])
+
+    def save(self) -> None:
+        """有变化时写入文件"""
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.watermark_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.watermark_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._marks, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.watermark_file)
+            self._dirty = False
+
+
+# 全局单例实例
+_watermarks_instance: ChatWatermarks | None = None
+
+def get_chat_watermarks() -> ChatWatermarks:
+    global _watermarks_instance
+    if _watermarks_instance is None:
+        base = get_config().base
+        _watermarks_instance = ChatWatermarks(os.path.join(base.pending_path, base.get('history_watermark_name')))
+    return _watermarks_instance
@@ -19,17 +19,72 @@ class AppConfig:
 
     DEFAULT_BASE = {
         "notify_user": "初代",
+        "notify_window": 10,  # 合并发给同一个人的通知的时间窗口（秒）
+        "notify_retries": 3,  # 通知发送失败后的重试次数
+        "notify_retry_delay": 5,  # 通知重试间隔（秒）
         "sleep_time": 2,
         "file_base_path": base_dir,
         "log_path": "日志",  # 注意这里只是相对路径名
         "pending_path": "单据处理",
         "pending_file_name": "待处理.csv",
+        "invoice_store": "sqlite",  # 待处理单据的存储: sqlite / journal
+        "pending_journal_name": "待处理.jsonl",
+        "pending_compact_bytes": 65536,
+        "history_watermark_name": "历史消息位置.json",
+        "listen_min_interval": 0.5,  # 收到消息后检查新消息的间隔（秒）
+        "listen_max_interval": 5,  # 没有消息时检查间隔的上限（秒）
+        "listen_backoff": 1.5,  # 没有消息时检查间隔放大的倍数
+        "message_source": "wxauto",  # 微信消息来源: wxauto / simulator
+        "sim_rate": 120,  # simulator 每分钟的消息数
+        "sim_duplicate_ratio": 0.1,  # simulator 重复以前单号的消息比例
+        "sim_multi_ratio": 0.2,  # simulator 包含多个单号的消息比例
+        "sim_script": "",  # simulator 回放的消息脚本，为空则随机生成
         "processed_path": "单据处理",
         "processed_file_name": "已处理.csv",
+        "processed_index_name": "已处理单号.txt",
+        "processed_archive_path": "已处理归档",
+        "processed_segment_format": "%Y%m",
         "base_result_dir": "处理结果",
+        "workflow": "workflow.yaml",
+        "trace_path": "耗时追踪",
+        "trace_summary_every": 20,
+        "backend": "pyautogui",
+        "replay_dir": "",
+        "replay_advance": "input",
+        "input_profile": "safe",  # 键鼠输入节奏: safe / fast
+        "input_safe_steps": [],  # 始终使用 safe 节奏的步骤
     }
 
-    RELATIVE_KEYS = ["log_path", "pending_path", "processed_path", "base_result_dir"]
+    RELATIVE_KEYS = ["log_path", "pending_path", "processed_path", "processed_archive_path", "base_result_dir",
+                     "trace_path"]
+
+    # 从微信消息中提取单号的规则，见 message_rules.MessageRules
+    DEFAULT_RULES = [
+        {"pattern": r"FHD\d{8}", "types": {"退货单": "退货单"}, "default_type": "发货单"},
+    ]
+
+    DEFAULT_MATCH = {
+        "grayscale": False,  # 预加载时是否同时生成灰度模板
+        "template_bundle": "",  # 预编译模板包路径，为空则不使用 ex: imgs/templates.npz
+        "roi_padding": 60,  # 在模板上次出现位置四周扩展的像素
+        "location_cache": "",  # 模板位置缓存文件，为空则只缓存在内存中
+        "engine": "opencv",  # 整屏查找使用的匹配引擎: opencv / pyramid
+        "engines": {},  # 单独指定某些模板使用的匹配引擎
+        "pyramid_levels": 2,  # 金字塔匹配最多缩小的层数
+        "poll_interval": 0.05,  # 等待界面变化时截屏的间隔（秒）
+        "print_timeout": 120,  # 等待打印窗口关闭的超时时间（秒）
+        "workers": 4,  # 同一帧匹配多个模板时的线程数，1 为顺序匹配
+        "adaptive_wait": True,  # 根据模板历史出现耗时决定等待时间
+        "latency_stats": "latency_stats.json",  # 模板出现耗时的保存文件，为空则不保存
+        "adaptive_max_wait": 30,  # 根据历史耗时计算的等待时间上限（秒）
+        "poll_growth": 1.5,  # 每次截屏后截屏间隔放大的倍数，1 为固定间隔
+        "poll_max_interval": 0.5,  # 截屏间隔的上限（秒）
+        "calibration": "calibration.yaml",  # 标定工具生成的模板阈值文件，为空则不使用
+        "thresholds": {},  # 单独指定模板的阈值 {模板名称: {confidence, grayscale}}，优先于标定结果
+        "verify_mode": "glyph",  # 校验单号的方式: glyph 从截图读取，clipboard 复制粘贴
+        "glyph_atlas": "imgs/glyphs.npz",  # 单号字形图集，文件不存在时使用复制粘贴
+        "invoice_field": [20, -12, 220, 24],  # 单号栏相对 fahuodanhao 中心点的 [x, y, 宽, 高]
+    }
 
     def __init__(self, config_path: str):
         if not os.path.exists(config_path):
@@ -43,10 +98,12 @@ class AppConfig:
     def _parse(self, data: dict):
         # 转成属性访问形式
         self.wechat_user = data.get("wechat_user", [])
+        self.rules = data.get("rules") or self.DEFAULT_RULES
 
         # 获取 paths 和 base 字典
         paths_data = data.get("paths", {})
         base_data = data.get("base", {})
+        match_data = data.get("match") or {}
 
         # 应用默认值
         for key, default in self.DEFAULT_BASE.items():
@@ -61,11 +118,28 @@ class AppConfig:
             if not os.path.isabs(value):
                 base_data[key] = os.path.normpath(os.path.join(base_dir, value))
 
+        for key, default in self.DEFAULT_MATCH.items():
+            match_data.setdefault(key, default)
+        match_data["thresholds"] = {**self._load_calibration(match_data["calibration"]), **match_data["thresholds"]}
+
         self.paths = ConfigNamespace(**paths_data)
         self.base = ConfigNamespace(**base_data)
+        self.match = ConfigNamespace(**match_data)
+
+    @classmethod
+    def _load_calibration(cls, path: str) -> dict:
+        """读取 python -m wechatv3.calibrate 生成的模板阈值"""
+        if not path:
+            return {}
+        if not os.path.isabs(path):
+            path = os.path.join(cls.base_dir, path)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return (yaml.safe_load(f) or {}).get("thresholds") or {}
 
     def __repr__(self):
-        return f"<AppConfig wechat_user={self.wechat_user}, paths={self.paths}, base={self.base}>"
+        return f"<AppConfig wechat_user={self.wechat_user}, paths={self.paths}, base={self.base}, match={self.match}>"
 
 # 全局单例实例
 _config_instance: AppConfig | None = None
@@ -1,3 +1,7 @@
 import threading
 
-global_pause = threading.Event()
\ No newline at end of file
+global_pause = threading.Event()
+
+# 操作屏幕的锁：处理单据、远程保活和发送微信通知都会移动鼠标、切换窗口或使用剪贴板，
+# 处理一个单据的整个过程持有这个锁，通知只在单据之间发送
+ui_lock = threading.Lock()
@@ -0,0 +1,161 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class GlyphReader:
+    """
+    用字形图集从截图上读取单号
+
+    单号栏是固定字体的一行字 (FHD + 数字)，不需要 OCR：二值化后按列投影切出每个字符，
+    再与预先从截图中切好的字形逐个比较。任意一个字符认不出时返回 None，由调用方改用复制粘贴的方式。
+    """
+
+    _META_KEY = '__meta__'
+
+    def __init__(self, atlas_path: str = '', min_score: float = 0.85, max_width_diff: int = 2):
+        """
+        :param atlas_path: 字形图集 .npz 路径
+        :param min_score: 字符与字形的相似度低于这个值时认为认不出
+        :param max_width_diff: 只与宽度相差不超过这个像素的字形比较
+        """
+        self.atlas_path = atlas_path
+        self.min_score = min_score
+        self.max_width_diff = max_width_diff
+        self.glyphs: dict[str, np.ndarray] = {}
+        if atlas_path and os.path.exists(atlas_path):
+            self._load()
+
+    @property
+    def available(self) -> bool:
+        return bool(self.glyphs)
+
+    def _load(self) -> None:
+        try:
+            with np.load(self.atlas_path) as bundle:
+                chars = json.loads(str(bundle[self._META_KEY]))
+                self.glyphs = {char: bundle[f'glyph{index}'] for index, char in enumerate(chars)}
+            logger.info(f"已加载字形图集: {''.join(sorted(self.glyphs))}")
+        except Exception as e:
+            logger.warning(f"读取字形图集失败: {self.atlas_path}, {e}")
+            self.glyphs = {}
+
+    def save(self) -> None:
+        chars = sorted(self.glyphs)
+        arrays = {f'glyph{index}': self.glyphs[char] for index, char in enumerate(chars)}
+        directory = os.path.dirname(self.atlas_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 字符作为 npz 的 key 时 F、f 在不区分大小写的文件系统上会冲突，按序号保存
+        tmp_path = self.atlas_path + '.tmp.npz'
+        np.savez_compressed(tmp_path, **{self._META_KEY: np.array(json.dumps(chars)), **arrays})
+        os.replace(tmp_path, self.atlas_path)
+
+    @staticmethod
+    def _ink_mask(image: np.ndarray) -> np.ndarray:
+        """二值化，文字为 1，背景为 0；选中行是深底白字，按像素少的一方作为文字"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        _, mask = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if mask.mean() > 0.5:
+            mask = 1 - mask
+        return mask
+
+    def segment(self, image: np.ndarray) -> list[np.ndarray]:
+        """按列投影切出每个字符，返回裁掉空白后的二值图"""
+        mask = self._ink_mask(image)
+        has_ink = mask.any(axis=0)
+        segments = []
+        start = None
+        for x, ink in enumerate(list(has_ink) + [False]):
+            if ink and start is None:
+                start = x
+            elif not ink and start is not None:
+                column = mask[:, start:x]
+                rows = np.flatnonzero(column.any(axis=1))
+                segments.append(column[rows[0]:rows[-1] + 1])
+                start = None
+        return segments
+
+    def _classify(self, glyph: np.ndarray) -> tuple[str, float]:
+        best_char, best_score = '', 0.0
+        height, width = glyph.shape
+        for char, reference in self.glyphs.items():
+            if abs(reference.shape[1] - width) > self.max_width_diff:
+                continue
+            resized = glyph if reference.shape == glyph.shape else \
+                cv2.resize(glyph, (reference.shape[1], reference.shape[0]), interpolation=cv2.INTER_NEAREST)
+            score = 1.0 - float(np.mean(resized != reference))
+            if score > best_score:
+                best_char, best_score = char, score
+        return best_char, best_score
+
+    def read(self, image: np.ndarray) -> str | None:
+        """读取截图中的文字，有字符认不出时返回 None"""
+        if not self.glyphs:
+            return None
+        text = []
+        for glyph in self.segment(image):
+            char, score = self._classify(glyph)
+            if score < self.min_score:
+                logger.debug(f"无法识别的字符，最接近 {char!r} 相似度 {score:.3f}")
+                return None
+            text.append(char)
+        return ''.join(text) or None
+
+    def learn(self, image: np.ndarray, text: str) -> None:
+        """从已知内容的截图中切出字形加入图集，切出的字符数必须与 text 一致"""
+        segments = self.segment(image)
+        if len(segments) != len(text):
+            raise ValueError(f"切出 {len(segments)} 个字符，与 '{text}' 的长度不一致，请调整 invoice_field 区域")
+        for char, glyph in zip(text, segments):
+            self.glyphs.setdefault(char, glyph)
+
+
+def field_region(anchor, field: list[int]) -> tuple[int, int, int, int]:
+    """单号栏在屏幕上的区域，field 为相对 fahuodanhao 中心点的 [x, y, width, height]"""
+    offset_x, offset_y, width, height = field
+    return anchor.x + offset_x, anchor.y + offset_y, width, height
+
+
+# 全局单例实例
+_reader_instance: GlyphReader | None = None
+
+def get_glyph_reader() -> GlyphReader:
+    global _reader_instance
+    if _reader_instance is None:
+        _reader_instance = GlyphReader(get_config().match.get('glyph_atlas'))
+    return _reader_instance
+
+
+if __name__ == '__main__':
+    # 从截图生成字形图集: python -m wechatv3.glyph_reader <截图> <截图中显示的单号> [<截图> <单号> ...]
+    # 多张截图的字形会合并，直到覆盖 FHD 和 0-9
+    import sys
+
+    from wechatv3.template_matcher import OpenCVMatcher, center
+    from wechatv3.template_registry import get_template_registry
+
+    reader = get_glyph_reader()
+    if not reader.atlas_path:
+        raise SystemExit("请先在 config.yaml 中配置 match.glyph_atlas")
+    anchor_template = get_template_registry().get('fahuodanhao')
+    field = get_config().match.get('invoice_field')
+    args = sys.argv[1:]
+    for screenshot_path, shown_text in zip(args[::2], args[1::2]):
+        screenshot = cv2.imdecode(np.fromfile(screenshot_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        anchor_box = OpenCVMatcher().locate(screenshot, anchor_template)
+        if anchor_box is None:
+            raise SystemExit(f"截图中没有找到 fahuodanhao: {screenshot_path}")
+        left, top, width, height = field_region(center(anchor_box), field)
+        reader.learn(screenshot[top:top + height, left:left + width], shown_text)
+    reader.save()
+    missing = [char for char in 'FHD0123456789' if char not in reader.glyphs]
+    logger.info(f"字形图集已保存: {reader.atlas_path}，已有 {''.join(sorted(reader.glyphs))}"
+                + (f"，还缺少 {''.join(missing)}" if missing else ''))
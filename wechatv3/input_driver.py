@@ -0,0 +1,118 @@
+import threading
+import time
+from dataclasses import dataclass
+
+from wechatv3.logger_config import LoggerManager
+from wechatv3.screen_backend import ScreenBackend
+
+logger = LoggerManager().get_logger()
+
+
+@dataclass(frozen=True)
+class InputProfile:
+    """键鼠输入的节奏"""
+    name: str
+    animate_moves: bool  # 点击前是否按调用处给的时长移动鼠标
+    pause: float  # 每个键鼠操作之后的停顿（pyautogui.PAUSE）
+    click_interval: float  # 双击两次点击的间隔
+    key_interval: float  # 逐个按键的间隔
+    settle: float  # 选中输入框后等待的时间
+    select_all: bool  # 输入框用 ctrl+a 选中后直接输入覆盖，否则逐个按退格删除
+    clear_presses: int  # 不用 ctrl+a 时按退格的次数
+
+
+PROFILES = {
+    # 与原来的操作节奏一致
+    'safe': InputProfile('safe', animate_moves=True, pause=0.1, click_interval=0.1, key_interval=0.1,
+                         settle=0.2, select_all=False, clear_presses=10),
+    # 不移动鼠标直接点击，全选后一次输入
+    'fast': InputProfile('fast', animate_moves=False, pause=0.0, click_interval=0.05, key_interval=0.0,
+                         settle=0.0, select_all=True, clear_presses=0),
+}
+
+
+class InputDriver:
+    """
+    按配置的节奏执行键鼠操作
+
+    每个操作都带有步骤名称，某个步骤出现过漏输入时调用 degrade，之后只有这个步骤改用 safe 节奏，
+    其余步骤仍然使用配置的节奏。base.input_safe_steps 中的步骤始终使用 safe 节奏。
+    """
+
+    def __init__(self, backend: ScreenBackend, profile: str = 'safe', safe_steps: list[str] | None = None):
+        if profile not in PROFILES:
+            raise ValueError(f"不支持的输入节奏: {profile}，可选: {list(PROFILES)}")
+        self.backend = backend
+        self.profile = PROFILES[profile]
+        self.safe_steps = set(safe_steps or [])
+        self._lock = threading.Lock()
+
+    def profile_for(self, step: str) -> InputProfile:
+        with self._lock:
+            return PROFILES['safe'] if step in self.safe_steps else self.profile
+
+    def degrade(self, step: str) -> bool:
+        """
+        步骤出现漏输入后改用 safe 节奏
+
+        :return: 是否是这次才改为 safe，已经是 safe 时返回 False，调用方不需要再重试
+        """
+        with self._lock:
+            if self.profile.name == 'safe' or step in self.safe_steps:
+                return False
+            self.safe_steps.add(step)
+        logger.warning(f"步骤 [{step}] 出现漏输入，之后改用 safe 节奏")
+        return True
+
+    def is_safe(self, step: str) -> bool:
+        """步骤是否已经使用 safe 节奏"""
+        return self.profile_for(step).name == 'safe'
+
+    def _begin(self, step: str, safe: bool = False) -> InputProfile:
+        profile = PROFILES['safe'] if safe else self.profile_for(step)
+        self.backend.set_pause(profile.pause)
+        return profile
+
+    def click(self, x, y, step: str = '', move: float = 0.0) -> None:
+        """点击，move 为点击前移动鼠标的时长，fast 节奏下不移动直接点击"""
+        profile = self._begin(step)
+        if move and profile.animate_moves:
+            self.backend.move_to(x, y, move)
+        self.backend.click(x, y)
+
+    def double_click(self, x, y, step: str = '', move: float = 0.0) -> None:
+        profile = self._begin(step)
+        if move and profile.animate_moves:
+            self.backend.move_to(x, y, move)
+        self.backend.double_click(x, y, interval=profile.click_interval)
+
+    def press(self, key, step: str = '') -> None:
+        self._begin(step)
+        self.backend.press(key)
+
+    def hotkey(self, *keys, step: str = '') -> None:
+        self._begin(step)
+        self.backend.hotkey(*keys)
+
+    def replace_text(self, x, y, text: str, step: str = '', submit: bool = True, safe: bool = False) -> None:
+        """
+        把输入框 (x, y) 的内容替换为 text
+
+        safe: 移动鼠标双击，逐个按退格清空，逐字输入；fast: 点击后 ctrl+a 全选，一次输入覆盖
+        :param submit: 输入后是否按回车
+        :param safe: 为 True 时这一次使用 safe 节奏，不改变步骤之后的节奏
+        """
+        profile = self._begin(step, safe)
+        if profile.animate_moves:
+            self.backend.move_to(x, y)
+        self.backend.double_click(x, y, interval=profile.click_interval)
+        if profile.settle:
+            time.sleep(profile.settle)
+        if profile.select_all:
+            self.backend.hotkey('ctrl', 'a')
+        else:
+            self.backend.press('backspace', presses=profile.clear_presses, interval=profile.key_interval)
+        self.backend.write(text, profile.key_interval)
+        if submit:
+            self.backend.press('enter')
+
@@ -0,0 +1,170 @@
+import csv
+import os
+import threading
+
+from wechatv3.common import get_config
+from wechatv3.invoice_record import MessageRecord, Status
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+PENDING_HEADER = ["编号", "类型", "时间", "联系人", "原始消息"]
+
+
+class InvoiceQueue:
+    """
+    待处理单据的持久化队列，记录为 [编号, 类型, 时间, 联系人, 原始消息]
+
+    处理流程: peek 取第一条 -> start 开始处理 -> finish 处理结束，之后 peek 返回下一条；
+    处理过程中出现异常没有调用 finish 时，下次 peek 仍然返回这一条。
+    """
+
+    name = ''
+
+    def append(self, record: list[str]) -> None:
+        raise NotImplementedError
+
+    def append_many(self, records: list[list[str]]) -> None:
+        """批量追加，子类可以合并为一次写入"""
+        for record in records:
+            self.append(record)
+
+    def peek(self) -> list[str] | None:
+        """第一条未处理的单据，没有时返回 None"""
+        raise NotImplementedError
+
+    def start(self, invoice_id: str) -> None:
+        """开始处理第一条单据"""
+
+    def finish(self, invoice_id: str, status: str, reason: str = '', duration: int = 0) -> None:
+        """第一条单据处理结束"""
+        raise NotImplementedError
+
+    def pending(self) -> list[list[str]]:
+        """全部未处理的单据"""
+        raise NotImplementedError
+
+    def last(self) -> list[str] | None:
+        """最后加入的单据（包括已处理的）"""
+        raise NotImplementedError
+
+    def export_csv(self, csv_file: str) -> None:
+        """把未处理的单据导出为 CSV，方便查看"""
+        records = self.pending()
+        tmp_path = csv_file + '.tmp'
+        with open(tmp_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(PENDING_HEADER)
+            writer.writerows(records)
+        os.replace(tmp_path, csv_file)
+
+
+class SQLiteInvoiceQueue(InvoiceQueue):
+    """
+    基于 MessageRecord 的 SQLite 队列
+
+    状态 待处理 -> 操作中 -> 已完成/操作失败 的变化都是按主键更新一行，
+    取下一条、启动时恢复都是按 (status, send_time) 索引的一次查询。
+    程序中断时停在 操作中 的单据下次启动会重新处理。
+    """
+
+    name = 'sqlite'
+
+    def __init__(self):
+        MessageRecord.init_db()
+        self._lock = threading.Lock()
+        self._current: MessageRecord | None = None
+
+    @staticmethod
+    def _to_record(message: MessageRecord) -> list[str]:
+        return [message.id, message.type, message.send_time, message.sender, message.original_message]
+
+    @staticmethod
+    def _to_message(record: list[str]) -> MessageRecord:
+        invoice_id, doc_type, send_time, sender, raw_msg = record
+        return MessageRecord(id=invoice_id, type=doc_type, sender=sender, original_message=raw_msg, duration=0,
+                             over_time='', send_time=send_time)
+
+    def append(self, record: list[str]) -> None:
+        self._to_message(record).enqueue()
+
+    def append_many(self, records: list[list[str]]) -> None:
+        """全部记录一个事务写入"""
+        MessageRecord.enqueue_many([self._to_message(record) for record in records])
+
+    def peek(self) -> list[str] | None:
+        with self._lock:
+            self._current = MessageRecord.next_open()
+            return self._to_record(self._current) if self._current else None
+
+    def _head(self, invoice_id: str) -> MessageRecord:
+        if self._current is None or self._current.id != invoice_id:
+            raise ValueError(f"单据 {invoice_id} 不是第一条未处理的单据")
+        return self._current
+
+    def start(self, invoice_id: str) -> None:
+        with self._lock:
+            self._head(invoice_id).set_status(Status.IN_PROGRESS)
+
+    def finish(self, invoice_id: str, status: str, reason: str = '', duration: int = 0) -> None:
+        with self._lock:
+            self._head(invoice_id).finish(Status(status), reason, duration)
+            self._current = None
+
+    def pending(self) -> list[list[str]]:
+        messages = MessageRecord.get_by_statuses(list(MessageRecord.OPEN_STATUSES))
+        return [self._to_record(message) for message in messages]
+
+    def last(self) -> list[str] | None:
+        message = MessageRecord.latest()
+        return self._to_record(message) if message else None
+
+
+def read_csv_rows(csv_file: str) -> list[list[str]]:
+    """读取 CSV 中除表头外的非空行"""
+    with open(csv_file, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [row for row in reader if row and any(field.strip() for field in row)]
+
+
+# 全局单例实例
+_queue_instance: InvoiceQueue | None = None
+
+def get_invoice_queue() -> InvoiceQueue:
+    """按 base.invoice_store 创建待处理队列，sqlite 第一次使用时导入旧版本的待处理日志或 CSV"""
+    global _queue_instance
+    if _queue_instance is None:
+        from wechatv3.pending_journal import PendingJournal, get_pending_journal
+
+        base = get_config().base
+        store = base.get('invoice_store')
+        if store == PendingJournal.name:
+            _queue_instance = get_pending_journal()
+        elif store == SQLiteInvoiceQueue.name:
+            is_new = not os.path.exists(MessageRecord.DB_PATH)
+            _queue_instance = SQLiteInvoiceQueue()
+            journal_file = os.path.join(base.pending_path, base.pending_journal_name)
+            csv_file = os.path.join(base.pending_path, base.pending_file_name)
+            if is_new and os.path.exists(journal_file):
+                legacy = PendingJournal(journal_file).pending()
+            elif is_new and os.path.exists(csv_file):
+                legacy = read_csv_rows(csv_file)
+            else:
+                legacy = []
+            _queue_instance.append_many(legacy)
+            if legacy:
+                logger.info(f"已导入 {len(legacy)} 条待处理单据到 {MessageRecord.DB_PATH}")
+        else:
+            raise ValueError(f"不支持的待处理存储: {store}")
+    return _queue_instance
+
+
+if __name__ == '__main__':
+    # 导出待处理单据: python -m wechatv3.invoice_queue [输出路径]
+    import sys
+
+    export_file = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(get_config().base.pending_path, get_config().base.pending_file_name)
+    get_invoice_queue().export_csv(export_file)
+    logger.info(f"待处理单据已导出: {export_file}")
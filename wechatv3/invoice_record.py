@@ -1,5 +1,5 @@
 import os
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from datetime import datetime
 from enum import Enum
 from typing import ClassVar, Optional, List
@@ -22,6 +22,10 @@ class MessageRecord:
     # 类常量
     TABLE_NAME: ClassVar[str] = "invoice"
     DB_PATH: ClassVar[str] = os.getcwd() + "/db/invoice.db"
+    # 未处理完的状态，启动时从这些状态恢复
+    OPEN_STATUSES: ClassVar[tuple[Status, ...]] = (Status.PENDING, Status.IN_PROGRESS)
+    # 批量更新时每条语句的单号个数
+    BATCH_SIZE: ClassVar[int] = 500
 
     # 数据字段
     id: str
@@ -32,11 +36,12 @@ class MessageRecord:
     over_time: str
     status: str = Status.PENDING.value
     reason: Optional[str] = None
-    send_time: str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    send_time: str = field(default_factory=lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
 
     @classmethod
     def init_db(cls):
-        """初始化数据库表（自动处理枚举转换）"""
+        """初始化数据库表（自动处理枚举转换），按状态和时间建索引，WAL 等 pragma 在连接时设置"""
+        os.makedirs(os.path.dirname(cls.DB_PATH), exist_ok=True)
         with SQLiteTool(cls.DB_PATH) as db:
             db.execute(f"""
                 CREATE TABLE IF NOT EXISTS {cls.TABLE_NAME} (
@@ -48,9 +53,12 @@ class MessageRecord:
                     duration INTEGER,
                     reason TEXT,
                     send_time TEXT,
-                    over_time TEXT,
+                    over_time TEXT
                 )
             """)
+            db.execute(f"CREATE INDEX IF NOT EXISTS idx_{cls.TABLE_NAME}_status_send_time "
+                       f"ON {cls.TABLE_NAME} (status, send_time)")
+            db.execute(f"CREATE INDEX IF NOT EXISTS idx_{cls.TABLE_NAME}_send_time ON {cls.TABLE_NAME} (send_time)")
 
     def to_dict(self) -> dict:
         """将实例转换为字典（类型安全的实现）"""
@@ -71,6 +79,16 @@ class MessageRecord:
         with SQLiteTool(self.DB_PATH) as db:
             db.insert(self.TABLE_NAME, self.to_dict())
 
+    def enqueue(self) -> None:
+        """加入待处理，单号已存在（以前处理过）时重新置为待处理"""
+        self.enqueue_many([self])
+
+    @classmethod
+    def enqueue_many(cls, records: List['MessageRecord']) -> int:
+        """批量加入待处理，全部记录一个事务提交，返回写入的条数"""
+        with SQLiteTool(cls.DB_PATH) as db:
+            return db.upsert_many(cls.TABLE_NAME, [record.to_dict() for record in records])
+
     @classmethod
     def from_row(cls, row: dict) -> 'MessageRecord':
         """从数据库行创建实例（字符串转枚举）"""
@@ -96,20 +114,69 @@ class MessageRecord:
             status_values = [s.value for s in statuses]
 
             all_data = db.fetchall(
-                f"SELECT * FROM {cls.TABLE_NAME} WHERE status IN ({placeholders})",
+                f"SELECT * FROM {cls.TABLE_NAME} WHERE status IN ({placeholders}) ORDER BY send_time, rowid",
                 tuple(status_values)
             )
             return [cls.from_row(row) for row in all_data]
 
+    @classmethod
+    def next_open(cls) -> Optional['MessageRecord']:
+        """最早的一条未处理完的记录"""
+        with SQLiteTool(cls.DB_PATH) as db:
+            placeholders = ','.join(['?'] * len(cls.OPEN_STATUSES))
+            row = db.fetchone(
+                f"SELECT * FROM {cls.TABLE_NAME} WHERE status IN ({placeholders}) ORDER BY send_time, rowid LIMIT 1",
+                tuple(s.value for s in cls.OPEN_STATUSES)
+            )
+            return cls.from_row(row) if row else None
+
+    @classmethod
+    def latest(cls) -> Optional['MessageRecord']:
+        """最后加入的一条记录（包括已处理的）"""
+        with SQLiteTool(cls.DB_PATH) as db:
+            row = db.fetchone(f"SELECT * FROM {cls.TABLE_NAME} ORDER BY send_time DESC, rowid DESC LIMIT 1")
+            return cls.from_row(row) if row else None
+
     def set_status(self,
                    new_status: Status,
                    reason: Optional[str] = None) -> None:
         if not isinstance(new_status, Status):
             raise ValueError("必须使用Status枚举成员")
 
-        self.status = new_status
+        self.status = new_status.value
+        self.reason = reason
+        self._update({'status': self.status, 'reason': self.reason})
+
+    def finish(self, new_status: Status, reason: Optional[str], duration: int) -> None:
+        """处理结束，一次更新状态、原因、耗时和结束时间"""
+        self.status = new_status.value
         self.reason = reason
-        self.save()
+        self.duration = duration
+        self.over_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._update({'status': self.status, 'reason': self.reason, 'duration': self.duration,
+                      'over_time': self.over_time})
+
+    @classmethod
+    def update_status_many(cls, ids: List[str], new_status: Status, reason: Optional[str] = None) -> int:
+        """批量修改状态，按 IN 分批更新，全部在一个事务中提交，返回影响的行数"""
+        if not isinstance(new_status, Status):
+            raise ValueError("必须使用Status枚举成员")
+
+        count = 0
+        with SQLiteTool(cls.DB_PATH) as db:
+            with db.transaction():
+                # SQLite 单条语句的参数个数有上限，分批拼接占位符
+                for start in range(0, len(ids), cls.BATCH_SIZE):
+                    batch = ids[start:start + cls.BATCH_SIZE]
+                    placeholders = ','.join(['?'] * len(batch))
+                    count += db.update(cls.TABLE_NAME, {'status': new_status.value, 'reason': reason},
+                                       f"id IN ({placeholders})", tuple(batch))
+        return count
+
+    def _update(self, data: dict) -> None:
+        """按主键只更新这一行的指定字段"""
+        with SQLiteTool(self.DB_PATH) as db:
+            db.update(self.TABLE_NAME, data, "id = ?", (self.id,))
 
 
 if __name__ == "__main__":
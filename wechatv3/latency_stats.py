@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from collections import deque
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class AppearanceStats:
+    """
+    每个模板从最近一次键鼠操作到出现在屏幕上的耗时分布
+
+    样本足够后，等待模板的超时时间由历史耗时的 p99 决定，而不是调用处写死的重试次数：
+    从不出现的模板不用白白等满，出现得慢的弹窗也不会过早放弃。
+    """
+
+    def __init__(self, stats_file: str = '', max_samples: int = 200, min_samples: int = 10,
+                 margin: float = 1.5, min_wait: float = 0.2, max_wait: float = 30):
+        """
+        :param stats_file: 保存耗时样本的文件，为空则不保存
+        :param max_samples: 每个模板保留最近多少个样本
+        :param min_samples: 样本少于这个数时仍使用调用处的默认超时
+        :param margin: 在 p99 的基础上再放宽的倍数
+        :param min_wait: 超时时间下限（秒）
+        :param max_wait: 超时时间上限（秒）
+        """
+        self.stats_file = stats_file
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.margin = margin
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def record(self, key: str, seconds: float) -> None:
+        """记录一次从操作到模板出现的耗时"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.max_samples)
+            samples.append(round(seconds, 3))
+            self._dirty = True
+
+    def percentile(self, key: str, p: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(key) or [])
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(len(samples) * p / 100), len(samples) - 1)]
+
+    def deadline(self, keys: list[str], default: float, elapsed: float = 0.0) -> float:
+        """
+        等待这些模板中任意一个出现的超时时间
+
+        :param default: 没有足够样本时使用的超时时间
+        :param elapsed: 距离最近一次操作已经过去的秒数
+        """
+        p99s = [self.percentile(key, 99) for key in keys]
+        if not p99s or any(p99 is None for p99 in p99s):
+            return default
+        learned = max(p99s) * self.margin - elapsed
+        return min(max(learned, self.min_wait), self.max_wait)
+
+    def summary(self) -> dict:
+        with self._lock:
+            keys = list(self._samples)
+        return {key: {'count': len(self._samples[key]), 'p50': self.percentile(key, 50),
+                      'p99': self.percentile(key, 99)} for key in keys}
+
+    def _load(self) -> None:
+        if not self.stats_file or not os.path.exists(self.stats_file):
+            return
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._samples = {key: deque(values, maxlen=self.max_samples) for key, values in data.items()}
+            logger.info(f"已加载模板出现耗时: {len(self._samples)} 个模板")
+        except Exception as e:
+            logger.warning(f"读取模板出现耗时失败: {self.stats_file}, {e}")
+
+    def save(self) -> None:
+        """有新样本时写入文件"""
+        if not self.stats_file:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {key: list(values) for key, values in self._samples.items()}
+            self._dirty = False
+        try:
+            directory = os.path.dirname(self.stats_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.stats_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.stats_file)
+        except OSError as e:
+            logger.warning(f"保存模板出现耗时失败: {self.stats_file}, {e}")
+
+
+# 全局单例实例
+_stats_instance: AppearanceStats | None = None
+
+def get_appearance_stats() -> AppearanceStats:
+    global _stats_instance
+    if _stats_instance is None:
+        match = get_config().match
+        _stats_instance = AppearanceStats(match.get('latency_stats'), max_wait=match.get('adaptive_max_wait'))
+    return _stats_instance
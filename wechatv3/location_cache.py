@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class LocationCache:
+    """
+    模板最近一次出现位置的缓存
+
+    ERP 的按钮基本每次都出现在同一个位置，查找时先在上次位置附近的小区域里找，
+    找不到再全屏查找。可选地把位置保存到文件，重启后继续使用。
+    """
+
+    def __init__(self, cache_file: str = '', padding: int = 60):
+        """
+        :param cache_file: 位置缓存文件，为空则只在内存中缓存
+        :param padding: 在上次位置四周扩展的像素
+        """
+        self.cache_file = cache_file
+        self.padding = padding
+        self._locations: dict[str, tuple[int, int, int, int]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, key: str) -> tuple[int, int, int, int] | None:
+        """上次找到的位置 (left, top, width, height)"""
+        return self._locations.get(key)
+
+    def region(self, key: str, screen_size: tuple[int, int] | None = None) -> tuple[int, int, int, int] | None:
+        """
+        上次位置四周扩展 padding 后的查找区域
+
+        :param screen_size: 屏幕大小 (width, height)，传入时区域会被限制在屏幕内
+        :return: (left, top, width, height)，没有记录时返回 None
+        """
+        location = self._locations.get(key)
+        if location is None:
+            return None
+        left, top, width, height = location
+        x1, y1 = max(left - self.padding, 0), max(top - self.padding, 0)
+        x2, y2 = left + width + self.padding, top + height + self.padding
+        if screen_size is not None:
+            x2, y2 = min(x2, screen_size[0]), min(y2, screen_size[1])
+        if x2 - x1 < width or y2 - y1 < height:
+            return None
+        return x1, y1, x2 - x1, y2 - y1
+
+    def update(self, key: str, box) -> None:
+        """记录模板位置，位置有变化时才写文件"""
+        location = (int(box[0]), int(box[1]), int(box[2]), int(box[3]))
+        with self._lock:
+            if self._locations.get(key) == location:
+                return
+            self._locations[key] = location
+            self._save()
+
+    def _load(self) -> None:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._locations = {key: tuple(value) for key, value in data.items()}
+            logger.info(f"已加载模板位置缓存: {len(self._locations)} 个")
+        except Exception as e:
+            logger.warning(f"读取模板位置缓存失败: {self.cache_file}, {e}")
+
+    def _save(self) -> None:
+        if not self.cache_file:
+            return
+        try:
+            directory = os.path.dirname(self.cache_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.cache_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._locations, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            logger.warning(f"保存模板位置缓存失败: {self.cache_file}, {e}")
+
+
+# 全局单例实例
+_cache_instance: LocationCache | None = None
+
+def get_location_cache() -> LocationCache:
+    global _cache_instance
+    if _cache_instance is None:
+        match = get_config().match
+        _cache_instance = LocationCache(match.get('location_cache'), padding=match.get('roi_padding'))
+    return _cache_instance
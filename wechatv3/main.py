@@ -1,4 +1,3 @@
-import csv
 import ctypes
 import os
 import threading
@@ -13,7 +12,11 @@ from wechatv3.global_var import global_pause
 from wechatv3.gui_msg import set_log_text_widget, log_message
 from wechatv3.logger_config import LoggerManager
 from wechatv3.msg_unique_queue import DedupQueue
+from wechatv3.invoice_queue import get_invoice_queue
 from wechatv3.process_invoice import InvoiceProcessor
+from wechatv3.processed_archive import get_processed_archive
+from wechatv3.processed_index import get_processed_index
+from wechatv3.sqlite_tool import SQLiteTool
 from wechatv3.wechat_client import WeChatListener
 
 logger = LoggerManager().get_logger()
@@ -81,7 +84,7 @@ class AppController:
         # 加载未处理文件中的数据
         self.preload_messages()
 
-        # 初始化已处理文件
+        # 初始化已处理记录
         self._init_processed_file()
 
         # 业务对象
@@ -113,50 +116,24 @@ class AppController:
 
     @staticmethod
     def _init_pending_file():
-        pending_file = os.path.join(get_config().base.pending_path, get_config().base.pending_file_name)
-
-        # 写入表头（如果不存在）
-        if not os.path.exists(pending_file):
-            os.makedirs(os.path.dirname(pending_file), exist_ok=True)
-            with open(pending_file, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(["编号", "类型", "时间", "联系人", "原始消息"])
-                return []
-        else:
-            with open(pending_file, 'r', newline='', encoding='utf-8-sig') as f:
-                reader = csv.reader(f)
-                next(reader, None)
-                rows = [row for row in reader if row and any(field.strip() for field in row)]
-                first_column = [row[0] for row in rows if row]
-                log_message(f'读取到未执行的单据: {", ".join(first_column)}')
-                logger.info(f'读取到未执行的单据: {", ".join(first_column)}')
-                return first_column
+        invoice_queue = get_invoice_queue()
+        # 导出一份 CSV 方便查看
+        invoice_queue.export_csv(os.path.join(get_config().base.pending_path, get_config().base.pending_file_name))
+        first_column = [row[0] for row in invoice_queue.pending() if row]
+        if first_column:
+            log_message(f'读取到未执行的单据: {", ".join(first_column)}')
+            logger.info(f'读取到未执行的单据: {", ".join(first_column)}')
+        return first_column
 
     @staticmethod
     def _init_processed_file():
-        processed_file = os.path.join(get_config().base.processed_path, get_config().base.processed_file_name)
-
-        if not os.path.exists(processed_file):
-            os.makedirs(os.path.dirname(processed_file), exist_ok=True)
-            with open(processed_file, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(["编号", "类型", "时间", "联系人", "状态", "原始消息", "原因"])
-        else:
-            # 清理已处理文件的历史数据
-            # 一次性读入
-            with open(processed_file, 'r', newline='', encoding='utf-8') as f:
-                rows = list(csv.reader(f))
-
-            # 提取所需行
-            if len(rows) > 201:
-                rows = [rows[0]] + rows[-200:]
-
-            # 重新写入
-            with open(processed_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerows(rows)
+        # 已处理记录按月份写入归档，第一次使用时导入旧的已处理文件，之后不再读取和截断
+        get_processed_archive()
+        get_processed_index()
 
     def show_queue(self):
+        get_invoice_queue().export_csv(
+            os.path.join(get_config().base.pending_path, get_config().base.pending_file_name))
         items = self.msg_queue.snapshot()
         if items:
             log_message(f"当前待处理单据: {items}")
@@ -190,7 +167,11 @@ class AppController:
 
     def run(self):
         self.start()
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            # 监听和处理线程随主线程退出，关闭它们保持的数据库连接，WAL 在关闭时写回数据库文件
+            SQLiteTool.close_all()
 
 if __name__ == '__main__':
     app = AppController()
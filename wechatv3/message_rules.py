@@ -0,0 +1,93 @@
+import bisect
+import re
+from dataclasses import dataclass
+
+from wechatv3.common import get_config
+
+
+@dataclass
+class ExtractedInvoice:
+    invoice_id: str
+    doc_type: str
+    sender: str  # 自己发送的消息为 '自己'
+    msg: object  # 原始微信消息
+
+
+class MessageRules:
+    """
+    从微信消息中提取单号的规则
+
+    每条规则包含单号的正则 pattern、类型关键字 types {关键字: 单据类型} 和没有关键字时的 default_type。
+    全部规则的单号正则合并为一个正则，全部关键字合并为另一个，一批消息拼接后各扫描一次，
+    再按位置分回各条消息，规则再多也不会对每条消息逐个规则匹配。互相重叠的关键字都会被找到。
+    """
+
+    SEPARATOR = '\0'  # 拼接消息的分隔符，单号和关键字都不会跨过它匹配
+
+    def __init__(self, rules: list[dict]):
+        if not rules:
+            raise ValueError("至少需要一条单号规则")
+        self.rules = rules
+        self._id_pattern = re.compile('|'.join(f"(?P<r{i}>{rule['pattern']})" for i, rule in enumerate(rules)))
+        # 关键字放在前瞻中，每个位置都尝试匹配，"退货单" 中的 "货单" 这类重叠的关键字也能找到；
+        # 同一位置只匹配最长的关键字，它的前缀关键字（"退货单" 中的 "退货"）一并记为出现
+        keywords = sorted({keyword for rule in rules for keyword in (rule.get('types') or {})}, key=len, reverse=True)
+        self._keyword_pattern = re.compile(f"(?=({'|'.join(map(re.escape, keywords))}))") if keywords else None
+        self._keyword_prefixes = {keyword: {other for other in keywords if keyword.startswith(other)}
+                                  for keyword in keywords}
+
+    def _doc_type(self, rule: dict, found_keywords: set[str]) -> str:
+        # 按配置中的顺序，第一个出现在消息中的关键字决定类型
+        for keyword, doc_type in (rule.get('types') or {}).items():
+            if keyword in found_keywords:
+                return doc_type
+        return rule.get('default_type', '')
+
+    def classify(self, msgs: list) -> list[ExtractedInvoice]:
+        """
+        提取一批消息中的单号，按消息和单号出现的顺序返回，同一批中重复的单号只保留第一个
+
+        :param msgs: 微信消息，需要有 content 和 sender
+        """
+        if not msgs:
+            return []
+        starts = []
+        position = 0
+        for msg in msgs:
+            starts.append(position)
+            position += len(msg.content) + len(self.SEPARATOR)
+        text = self.SEPARATOR.join(msg.content for msg in msgs)
+
+        keywords: dict[int, set[str]] = {}
+        if self._keyword_pattern is not None:
+            for found in self._keyword_pattern.finditer(text):
+                index = bisect.bisect_right(starts, found.start()) - 1
+                keywords.setdefault(index, set()).update(self._keyword_prefixes[found.group(1)])
+
+        results = []
+        seen = set()
+        for found in self._id_pattern.finditer(text):
+            invoice_id = found.group()
+            if invoice_id in seen:
+                continue
+            seen.add(invoice_id)
+            index = bisect.bisect_right(starts, found.start()) - 1
+            rule = self.rules[int(found.lastgroup[1:])]
+            msg = msgs[index]
+            results.append(ExtractedInvoice(
+                invoice_id=invoice_id,
+                doc_type=self._doc_type(rule, keywords.get(index, set())),
+                sender='自己' if msg.sender == 'Self' else msg.sender,
+                msg=msg,
+            ))
+        return results
+
+
+# 全局单例实例
+_rules_instance: MessageRules | None = None
+
+def get_message_rules() -> MessageRules:
+    global _rules_instance
+    if _rules_instance is None:
+        _rules_instance = MessageRules(get_config().rules)
+    return _rules_instance
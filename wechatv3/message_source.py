@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class MessageSource:
+    """微信消息的来源，WeChatListener 只通过它读取消息和发送通知"""
+
+    name = ''
+
+    def connect(self, chats: list[str]) -> None:
+        """连接微信，chats 为需要监听的聊天"""
+        raise NotImplementedError
+
+    def chat_with(self, who: str) -> None:
+        """打开聊天窗口，之后 get_all_messages 返回这个聊天的消息"""
+        raise NotImplementedError
+
+    def get_all_messages(self) -> list:
+        """当前聊天已加载的全部消息，从旧到新，消息需要有 sender 和 content"""
+        raise NotImplementedError
+
+    def load_more(self) -> None:
+        """向上加载更早的消息"""
+        raise NotImplementedError
+
+    def add_listen_chat(self, who: str) -> None:
+        raise NotImplementedError
+
+    def get_listen_messages(self) -> dict:
+        """上次调用之后监听的聊天收到的新消息 {聊天: [消息]}"""
+        raise NotImplementedError
+
+    def send(self, content: str, who: str) -> None:
+        """发送消息，失败时抛出异常"""
+        raise NotImplementedError
+
+
+class WxautoSource(MessageSource):
+    """生产环境使用的 wxauto 实现"""
+
+    name = 'wxauto'
+
+    def __init__(self):
+        from pywinauto import Application
+        from wxauto import WeChat
+
+        self._application = Application
+        self._wechat = WeChat
+        self._wx = None
+
+    def connect(self, chats: list[str]) -> None:
+        # 先关闭已经单独打开的聊天窗口，wxauto 只能操作主窗口中的聊天
+        try:
+            for name in chats:
+                app = self._application().connect(title=name)
+                window = app.window(title=name)
+                window.close()
+        except Exception:
+            pass
+        time.sleep(0.5)
+        self._wx = self._wechat()
+        self._wx.GetSessionList()
+
+    def chat_with(self, who: str) -> None:
+        self._wx.ChatWith(who, timeout=30)
+
+    def get_all_messages(self) -> list:
+        return self._wx.GetAllMessage()
+
+    def load_more(self) -> None:
+        self._wx.LoadMoreMessage()
+
+    def add_listen_chat(self, who: str) -> None:
+        self._wx.AddListenChat(who)
+
+    def get_listen_messages(self) -> dict:
+        return self._wx.GetListenMessage()
+
+    def send(self, content: str, who: str) -> None:
+        self._wx.SendMsg(content, who)
+
+
+@dataclass
+class SimulatedMessage:
+    sender: str
+    content: str
+    created_at: float = field(default_factory=time.monotonic)  # 消息到达的时间，用于统计入队耗时
+
+
+class SimulatedSource(MessageSource):
+    """
+    模拟的消息流，用于在没有微信的环境中压测接收单据的流程
+
+    按每分钟 rate 条的速度产生消息，两次读取之间到期的消息一起返回。
+    有脚本时按顺序循环回放脚本中的消息，没有时随机生成单号，
+    其中 duplicate_ratio 比例的消息重复发送以前的单号，multi_ratio 比例的消息包含多个单号。
+    """
+
+    name = 'simulator'
+
+    def __init__(self, rate: float = 120, duplicate_ratio: float = 0.1, multi_ratio: float = 0.2,
+                 script: str = '', seed: int | None = None):
+        """
+        :param rate: 每分钟的消息数
+        :param duplicate_ratio: 重复以前单号的消息比例
+        :param multi_ratio: 包含多个单号的消息比例
+        :param script: 消息脚本，每行 "发送人|内容"，为空则随机生成
+        :param seed: 随机数种子，固定后每次生成相同的消息
+        """
+        self.rate = rate
+        self.duplicate_ratio = duplicate_ratio
+        self.multi_ratio = multi_ratio
+        self._random = random.Random(seed)
+        self._script = self._load_script(script) if script else []
+        self._lock = threading.Lock()
+        self._chats: list[str] = []
+        self._history: dict[str, list[SimulatedMessage]] = {}
+        self._current = ''
+        self._sent: list[str] = []  # 已生成的单号，用于生成重复消息
+        self._next_no = self._random.randrange(10 ** 7, 9 * 10 ** 7)
+        self._generated = 0
+        self._started_at = 0.0
+        self.outbox: list[tuple[str, str]] = []  # 发送的通知 (接收人, 内容)
+
+    @staticmethod
+    def _load_script(path: str) -> list[tuple[str, str]]:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = [line.rstrip('\n') for line in f if line.strip()]
+        return [tuple(line.split('|', 1)) if '|' in line else ('Self', line) for line in lines]
+
+    def connect(self, chats: list[str]) -> None:
+        self._chats = list(chats) or ['模拟聊天']
+        self._started_at = time.monotonic()
+
+    def chat_with(self, who: str) -> None:
+        self._current = who
+
+    def get_all_messages(self) -> list:
+        return list(self._history.get(self._current, []))
+
+    def load_more(self) -> None:
+        """模拟的聊天只有本次运行中产生的消息"""
+
+    def add_listen_chat(self, who: str) -> None:
+        if who not in self._chats:
+            self._chats.append(who)
+
+    def _new_id(self) -> str:
+        if self._sent and self._random.random() < self.duplicate_ratio:
+            return self._random.choice(self._sent)
+        self._next_no += 1
+        invoice_id = f"FHD{self._next_no:08d}"
+        self._sent.append(invoice_id)
+        return invoice_id
+
+    def _next_message(self) -> SimulatedMessage:
+        if self._script:
+            sender, content = self._script[self._generated % len(self._script)]
+        else:
+            count = self._random.randint(2, 4) if self._random.random() < self.multi_ratio else 1
+            ids = ' '.join(self._new_id() for _ in range(count))
+            doc_type = '退货单' if self._random.random() < 0.1 else '发货单'
+            sender, content = self._random.choice(['Self', '仓库', '客服']), f"{doc_type} {ids}"
+        self._generated += 1
+        return SimulatedMessage(sender, content)
+
+    def get_listen_messages(self) -> dict:
+        with self._lock:
+            due = int((time.monotonic() - self._started_at) * self.rate / 60) - self._generated
+            messages: dict[str, list[SimulatedMessage]] = {}
+            for _ in range(max(due, 0)):
+                chat = self._chats[self._generated % len(self._chats)]
+                # 消息按速率应该到达的时间，包括等待下一次读取的时间
+                arrived_at = self._started_at + (self._generated + 1) * 60 / self.rate
+                msg = self._next_message()
+                msg.created_at = arrived_at
+                messages.setdefault(chat, []).append(msg)
+                self._history.setdefault(chat, []).append(msg)
+            return messages
+
+    @property
+    def generated(self) -> int:
+        """已产生的消息数"""
+        return self._generated
+
+    def send(self, content: str, who: str) -> None:
+        self.outbox.append((who, content))
+
+
+# 全局单例实例
+_source_instance: MessageSource | None = None
+
+def get_message_source() -> MessageSource:
+    global _source_instance
+    if _source_instance is None:
+        base = get_config().base
+        name = base.get('message_source')
+        if name == SimulatedSource.name:
+            _source_instance = SimulatedSource(rate=base.get('sim_rate'), duplicate_ratio=base.get('sim_duplicate_ratio'),
+                                               multi_ratio=base.get('sim_multi_ratio'), script=base.get('sim_script'))
+        elif name == WxautoSource.name:
+            _source_instance = WxautoSource()
+        else:
+            raise ValueError(f"不支持的消息来源: {name}")
+    return _source_instance
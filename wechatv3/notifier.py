@@ -0,0 +1,89 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+from wechatv3.gui_msg import log_message
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class Notifier:
+    """
+    后台发送微信通知
+
+    notify 只把消息放入队列后立即返回，处理单据的线程不用等待微信界面发送。
+    后台线程取到第一条消息后再等待 window 秒，期间发给同一个人的消息合并成一条发送，
+    连续失败多个单据时不会逐条刷屏；发送失败时间隔 retry_delay 秒重试，最多 retries 次。
+    send 需要自己等待正在处理的单据结束，见 global_var.ui_lock。
+    """
+
+    def __init__(self, send: Callable[[str, str], None], window: float = 10, retries: int = 3,
+                 retry_delay: float = 5):
+        """
+        :param send: 实际发送的函数 send(内容, 接收人)，失败时抛出异常
+        :param window: 合并消息的时间窗口（秒），0 为不等待，只合并已在队列中的消息
+        :param retries: 发送失败后的重试次数
+        :param retry_delay: 重试间隔（秒）
+        """
+        self._send = send
+        self.window = window
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+
+    def notify(self, content: str, who: str) -> None:
+        """加入发送队列，不等待发送完成"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._send_loop, name='notifier', daemon=True)
+                self._worker.start()
+        self._queue.put((content, who))
+
+    def _collect(self) -> list[tuple[str, str]]:
+        """取出时间窗口内的全部消息"""
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while True:
+            try:
+                items.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                return items
+
+    def _send_loop(self) -> None:
+        while True:
+            items = self._collect()
+            # 按接收人合并，保持各自的先后顺序
+            digests: dict[str, list[str]] = {}
+            for content, who in items:
+                digests.setdefault(who, []).append(content)
+            try:
+                for who, contents in digests.items():
+                    self._send_with_retry(self.format_digest(contents), who)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    @staticmethod
+    def format_digest(contents: list[str]) -> str:
+        if len(contents) == 1:
+            return contents[0]
+        return f"共 {len(contents)} 条通知:\n" + '\n'.join(contents)
+
+    def _send_with_retry(self, content: str, who: str) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                self._send(content, who)
+                return
+            except Exception as e:
+                logger.warning(f"微信消息发送失败（第 {attempt + 1} 次）: [{who}] {e}")
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay)
+        log_message(f"微信消息发送失败: [{who}]-->{content}")
+
+    def flush(self) -> None:
+        """等待队列中的消息全部发送（或放弃）"""
+        self._queue.join()
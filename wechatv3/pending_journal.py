@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+
+from wechatv3.common import get_config
+from wechatv3.invoice_queue import InvoiceQueue, read_csv_rows
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class PendingJournal(InvoiceQueue):
+    """
+    只追加的待处理单据日志
+
+    每行一条 JSON 记录 [编号, 类型, 时间, 联系人, 原始消息]，新单据追加到末尾；
+    处理完成的位置保存在游标文件中，取第一条未处理的单据只需要从游标处读一行，
+    不再每处理一个单据就读取并重写整个文件。已处理的部分超过 compact_bytes 时压缩，只保留未处理的记录。
+
+    日志第一行记录压缩的代数，游标文件中保存 {代数, 位置}，压缩时先替换日志再重置游标，
+    两步之间中断时游标的代数与日志不一致，从新日志的开头继续，不会丢失或重复单据。
+    """
+
+    name = 'journal'
+
+    def __init__(self, journal_file: str, compact_bytes: int = 64 * 1024):
+        """
+        :param journal_file: 日志文件路径，游标保存在同目录的 .cursor 文件
+        :param compact_bytes: 已处理部分超过这个字节数，并且超过文件的一半时压缩
+        """
+        self.journal_file = journal_file
+        self.cursor_file = os.path.splitext(journal_file)[0] + '.cursor'
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._offset = 0
+        self._peeked: tuple[int, list[str]] | None = None  # (下一条的位置, 记录)
+        self._open()
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.journal_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.journal_file):
+            self._write_journal(0, [])
+        self._repair_tail()
+        with open(self.journal_file, 'rb') as f:
+            header = f.readline()
+        self._generation = json.loads(header)['generation']
+        cursor = self._read_cursor()
+        if cursor.get('generation') == self._generation:
+            self._offset = max(cursor['offset'], len(header))
+        else:
+            self._offset = len(header)
+
+    def _repair_tail(self) -> None:
+        """写入中途断电时最后一行不完整，截断到最后一个换行"""
+        with open(self.journal_file, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b'\n':
+                return
+            block = min(size, 64 * 1024)
+            f.seek(size - block)
+            last_newline = f.read(block).rfind(b'\n')
+            f.truncate(size - block + last_newline + 1 if last_newline >= 0 else 0)
+            logger.warning(f"待处理日志最后一行不完整，已截断: {self.journal_file}")
+
+    def _read_cursor(self) -> dict:
+        if not os.path.exists(self.cursor_file):
+            return {}
+        try:
+            with open(self.cursor_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取待处理游标失败，从头开始: {e}")
+            return {}
+
+    def _write_cursor(self) -> None:
+        tmp_path = self.cursor_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'generation': self._generation, 'offset': self._offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.cursor_file)
+
+    def _write_journal(self, generation: int, records: list[list[str]]) -> None:
+        tmp_path = self.journal_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._encode({'generation': generation}))
+            for record in records:
+                f.write(self._encode(record))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_file)
+
+    @staticmethod
+    def _encode(record) -> bytes:
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def append(self, record: list[str]) -> None:
+        """追加一条待处理单据"""
+        self.append_many([record])
+
+    def append_many(self, records: list[list[str]]) -> None:
+        """追加多条待处理单据，一次写入一次 fsync"""
+        if not records:
+            return
+        data = b''.join(self._encode(record) for record in records)
+        with self._lock:
+            with open(self.journal_file, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def peek(self) -> list[str] | None:
+        """第一条未处理的单据，没有时返回 None"""
+        with self._lock:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(self._offset)
+                line = f.readline()
+            if not line.endswith(b'\n'):
+                self._peeked = None
+                return None
+            record = json.loads(line)
+            self._peeked = (self._offset + len(line), record)
+            return record
+
+    def ack(self, invoice_id: str) -> None:
+        """第一条单据处理完成，游标移到下一条"""
+        with self._lock:
+            if self._peeked is None or self._peeked[1][0] != invoice_id:
+                raise ValueError(f"确认的单据 {invoice_id} 不是第一条未处理的单据")
+            self._offset, self._peeked = self._peeked[0], None
+            self._write_cursor()
+            if self._offset >= self.compact_bytes and self._offset * 2 >= os.path.getsize(self.journal_file):
+                self._compact()
+
+    def finish(self, invoice_id: str, status: str, reason: str = '', duration: int = 0) -> None:
+        """处理结果记录在已处理文件中，日志只需要移动游标"""
+        self.ack(invoice_id)
+
+    def _compact(self) -> None:
+        """只保留未处理的记录，调用前需要持有锁"""
+        records = self._read_records()
+        self._generation += 1
+        self._write_journal(self._generation, records)
+        with open(self.journal_file, 'rb') as f:
+            self._offset = len(f.readline())
+        self._write_cursor()
+        logger.info(f"待处理日志已压缩，剩余 {len(records)} 条")
+
+    def _read_records(self) -> list[list[str]]:
+        with open(self.journal_file, 'rb') as f:
+            f.seek(self._offset)
+            return [json.loads(line) for line in f if line.endswith(b'\n')]
+
+    def pending(self) -> list[list[str]]:
+        with self._lock:
+            return self._read_records()
+
+    def last(self) -> list[str] | None:
+        """最后追加的单据（包括已处理的），只读取文件末尾"""
+        with self._lock:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                block = min(size, 64 * 1024)
+                f.seek(size - block)
+                lines = f.read(block).splitlines()
+        if block < size:
+            lines = lines[1:]  # 第一行可能不完整
+        for line in reversed(lines):
+            record = json.loads(line) if line.startswith(b'[') else None
+            if record and record[0].strip():
+                return record
+        return None
+
+    def import_csv(self, csv_file: str) -> int:
+        """导入旧版本的待处理 CSV，返回导入的条数"""
+        rows = read_csv_rows(csv_file)
+        self.append_many(rows)
+        return len(rows)
+
+
+# 全局单例实例
+_journal_instance: PendingJournal | None = None
+
+def get_pending_journal() -> PendingJournal:
+    global _journal_instance
+    if _journal_instance is None:
+        base = get_config().base
+        journal_file = os.path.join(base.pending_path, base.pending_journal_name)
+        is_new = not os.path.exists(journal_file)
+        _journal_instance = PendingJournal(journal_file, compact_bytes=base.get('pending_compact_bytes'))
+        # 第一次使用时导入旧版本的待处理 CSV
+        csv_file = os.path.join(base.pending_path, base.pending_file_name)
+        if is_new and os.path.exists(csv_file):
+            count = _journal_instance.import_csv(csv_file)
+            logger.info(f"已从 {csv_file} 导入 {count} 条待处理单据")
+    return _journal_instance
+
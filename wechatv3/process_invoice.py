@@ -1,22 +1,32 @@
-import csv
-import os
 import queue
 import threading
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-import pyautogui
-import pyperclip
-from pyautogui import ImageNotFoundException
-from pywinauto import Application
+import cv2
 
-from wechatv3.global_var import global_pause
+from wechatv3.global_var import global_pause, ui_lock
 from wechatv3.gui_msg import log_message
 from wechatv3.logger_config import LoggerManager, InvoiceLoggerAdapter
 from wechatv3.common import get_config
+from wechatv3.glyph_reader import get_glyph_reader, field_region
+from wechatv3.input_driver import InputDriver
+from wechatv3.latency_stats import get_appearance_stats
+from wechatv3.invoice_queue import get_invoice_queue
+from wechatv3.processed_archive import get_processed_archive
+from wechatv3.processed_index import get_processed_index
+from wechatv3.result_log import get_result_log
+from wechatv3.location_cache import get_location_cache
+from wechatv3.screen_backend import ScreenBackend, get_backend
+from wechatv3.template_matcher import OpenCVMatcher, get_matcher, center
+from wechatv3.template_registry import get_template_registry
+from wechatv3.tracing import get_tracer
+from wechatv3.workflow import WorkflowEngine, SUCCESS, get_workflow_path
 
 logger = LoggerManager().get_logger()
 _invoice_logger: InvoiceLoggerAdapter | None = None
@@ -50,97 +60,63 @@ class InvoiceProcessor:
     def __init__(self, wechat_client):
         self.wechat_client = wechat_client
         self.worker = InvoiceAutomationWorker(wechat_client)
+        self.pending = get_invoice_queue()  # 待处理单据
+        self.processed = get_processed_index()  # 已处理单号
+        self.archive = get_processed_archive()  # 已处理记录
+        self.results = get_result_log()  # 处理结果
 
         logger.info("任务实例初始化")
 
-    def _read_pending_file(self):
-        pending_file = os.path.join(get_config().base.pending_path, get_config().base.pending_file_name)
-        if not os.path.exists(pending_file):
-            logger.error("找不到待处理文件")
-            log_message("找不到待处理文件")
-            return None, None
-
-        # 读取所有待处理数据（跳过表头）
-        with open(pending_file, "r", encoding="utf-8-sig") as f:
-            reader = csv.reader(f)
-            rows = [row for row in reader if row and any(field.strip() for field in row)]
-            if len(rows) <= 1:
-                return None, None
-
-            header = rows[0]
-            data_rows = rows[1:]
-
-        return header, data_rows
-
     def save_processed(self, invoice_id, doc_type, sender, raw_msg, status, reason):
-        processed_file = os.path.join(get_config().base.processed_path, get_config().base.processed_file_name)
+        """已处理记录写入当月的归档分段，并加入已处理单号索引"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if os.path.exists(processed_file):
-            with open(processed_file, 'a', newline='', encoding='utf-8-sig') as f:
-                if reason is not None:
-                    if isinstance(reason, Exception):
-                        reason = str(reason)
-                    reason = reason.replace('\n', ' ').replace(',', '，').strip()
-                else:
-                    reason = ''
-                f.write(f"{invoice_id},{doc_type},{timestamp},{sender},{status},{raw_msg},{reason}\n")
+        if reason is not None:
+            if isinstance(reason, Exception):
+                reason = str(reason)
+            reason = reason.replace('\n', ' ').replace(',', '，').strip()
+        else:
+            reason = ''
+        self.archive.append([invoice_id, doc_type, timestamp, sender, status, raw_msg, reason])
+        self.processed.add(invoice_id)
 
     def _process_one_invoice(self):
         global _invoice_logger
         result: ProcessResult | None = None
 
-        header, data_rows = self._read_pending_file()
-        if header is None or data_rows is None:
+        record = self.pending.peek()
+        if record is None:
             logger.info("没有待处理数据")
             log_message("没有待处理数据")
             return
 
-        invoice_id, doc_type, timestamp, sender, raw_message = data_rows[0]
+        invoice_id, doc_type, timestamp, sender, raw_message = record
 
         _invoice_logger = LoggerManager().get_invoice_logger(invoice_id)
 
         _invoice_logger.info(f"开始处理单据: {invoice_id}")
         log_message(f"开始处理单据: {invoice_id}")
+        self.pending.start(invoice_id)
 
         try:
             start_time = time.time()
 
-            result = self.worker.do_process_invoices(invoice_id, doc_type)
+            with ui_lock, get_tracer().trace(invoice_id, doc_type=doc_type) as trace:
+                result = self.worker.do_process_invoices(invoice_id, doc_type)
+                trace.attrs['status'] = result.status.value
+                trace.attrs['reason'] = result.reason
+            self.worker.appearance.save()
 
             duration = int(time.time() - start_time)
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            result_text = (
-                f"单据号: {invoice_id}\n"
-                f"单据类型: {doc_type}\n"
-                f"处理开始时间: {now}\n"
-                f"处理时长: {duration} 秒\n"
-                f"状态: {result.status.value}\n"
-                f"备注信息: {result.reason}\n"
-                f"源消息: {raw_message}\n"
-            )
-
-            # 结果写入文件
-            today_dir = datetime.now().strftime("%Y%m%d")
-            result_dir = os.path.join(get_config().base.base_result_dir, today_dir)
-            os.makedirs(result_dir, exist_ok=True)
-
-            time_part = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%H%M%S")
-            result_file_path = os.path.join(result_dir, f"{invoice_id}_{time_part}.txt")
-
-            with open(result_file_path, "w", encoding="utf-8") as f:
-                f.write(result_text)
-
-            _invoice_logger.info(f"结果保存在: {result_file_path}")
-            log_message(f"结果保存在: {result_file_path}")
-
-            # 从 CSV 移除已处理项
-            header1, data_rows1 = self._read_pending_file()
-            remaining = [header1] + data_rows1[1:]
-            pending_path = os.path.join(get_config().base.pending_path, get_config().base.pending_file_name)
-            with open(pending_path, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.writer(f)
-                writer.writerows(remaining)
+
+            # 结果追加到当天的结果文件，由后台线程写入
+            self.results.write(invoice_id=invoice_id, doc_type=doc_type, received_at=timestamp, duration=duration,
+                               status=result.status.value, reason=result.reason, raw_message=raw_message)
+
+            _invoice_logger.info(f"结果保存在: {self.results.day_file()}")
+            log_message(f"结果保存在: {self.results.day_file()}")
+
+            # 记录处理结果，之后取下一条
+            self.pending.finish(invoice_id, result.status.value, result.reason, duration)
 
             self.save_processed(invoice_id=invoice_id, doc_type=doc_type, sender=sender, raw_msg=raw_message,
                                 status=result.status.value, reason=result.reason)
@@ -181,9 +157,9 @@ class InvoiceProcessor:
             log_message(f"无任务，远程保活中")
             self.worker.bring_window_to_front()
             searchx, searchy = self.worker.find_search_input()
-            pyautogui.moveTo(searchx, searchy, 0.3)
-            pyautogui.doubleClick(searchx, searchy)
-            pyautogui.press('backspace')
+            driver = self.worker.input
+            driver.double_click(searchx, searchy, step='keep_alive', move=0.3)
+            driver.press('backspace', step='keep_alive')
             logger.info(f"执行防断连点击操作，位置: {searchx}, {searchy}")
 
         while True:
@@ -193,26 +169,34 @@ class InvoiceProcessor:
                 if not keep_remote.is_set():
                     logger.info(f"有任务，远程保活停止")
                     log_message(f"有任务，远程保活停止")
-                do_keep()
+                with ui_lock:
+                    do_keep()
             except Exception as e:
                 pass
             time.sleep(10)
 
 
 class InvoiceAutomationWorker:
-    def __init__(self, wechat_client):
+    def __init__(self, wechat_client, backend: ScreenBackend | None = None):
         self.wechat_client = wechat_client
+        self.backend = backend or get_backend()  # 截屏和键鼠输入
+        base = get_config().base
+        self.input = InputDriver(self.backend, base.get('input_profile'), base.get('input_safe_steps'))  # 键鼠输入节奏
         self.image_paths = get_config().paths  # 字典形式管理路径
-
-        pyautogui.FAILSAFE = False
+        self.templates = get_template_registry()  # 启动时预加载全部模板
+        self.locations = get_location_cache()  # 模板上次出现的位置
+        self.appearance = get_appearance_stats()  # 模板从操作到出现的耗时分布
+        self.roi_matcher = OpenCVMatcher()  # 上次位置附近的小区域直接按原分辨率匹配
+        # 同一帧匹配多个模板时使用的线程池，OpenCV 匹配时会释放 GIL
+        match_workers = get_config().match.get('workers')
+        self.match_pool = ThreadPoolExecutor(match_workers, thread_name_prefix='match') if match_workers > 1 else None
+        self.workflow = WorkflowEngine.load(get_workflow_path(), self)  # 单据处理流程
 
     # 将远程桌面置于顶层
     def bring_window_to_front(self, window_title=get_config().base.get('remote_win_name')):
         global_pause.wait()
         try:
-            app = Application().connect(title=window_title)
-            window = app.window(title=window_title)
-            window.set_focus()  # 设置窗口为最上层
+            self.backend.focus_window(window_title)
             logger.info(f"窗口 '{window_title}' 已被设置为最上层")
         except Exception as e:
             logger.error(f"找不到窗口 '{window_title}'")
@@ -220,28 +204,296 @@ class InvoiceAutomationWorker:
             raise e
 
 
-    def safe_locate_center(self, image_key, confidence=0.9, grayscale=False, min_search_time=10):
-        image_path = self.image_paths.get(image_key)
-        try:
-            return pyautogui.locateCenterOnScreen(image_path, confidence=confidence, grayscale=grayscale,
-                                                  minSearchTime=min_search_time)
-        except ImageNotFoundException:
-            logger.error(f"未找到元素: {image_path}")
+    def _grab(self, region=None):
+        """截屏，返回 OpenCV 的 BGR 数组"""
+        return self.backend.screenshot(region)
+
+    def _match(self, image_key, frame, confidence=0.9, grayscale=False, origin=(0, 0), matcher=None):
+        """
+        在截图上匹配模板，origin 为截图左上角在屏幕上的坐标，返回屏幕坐标的 Box
+
+        match.thresholds 中有该模板的阈值（标定结果或手动指定）时，使用其中的 confidence 和 grayscale
+        """
+        threshold = get_config().match.thresholds.get(image_key) or {}
+        confidence = threshold.get('confidence', confidence)
+        # 已经转成灰度的截图只能用灰度模板匹配
+        grayscale = threshold.get('grayscale', grayscale) or frame.ndim == 2
+        template = self.templates.get(image_key, grayscale=grayscale)
+        if grayscale and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        matcher = matcher or get_matcher(image_key)
+        box = matcher.locate(frame, template, confidence)
+        if box is None:
             return None
+        return box._replace(left=box.left + origin[0], top=box.top + origin[1])
+
+    def _locate_in_frame(self, image_key, frame, confidence=0.9, grayscale=False, cancel: threading.Event = None):
+        """
+        在整屏截图上匹配模板，先匹配上次出现位置附近的区域
+
+        :param cancel: 已经不需要结果时被设置，不再进行耗时的整屏匹配
+        """
+        region = self.locations.region(image_key, (frame.shape[1], frame.shape[0]))
+        box = None
+        if region is not None:
+            left, top, width, height = region
+            roi = frame[top:top + height, left:left + width]
+            box = self._match(image_key, roi, confidence, grayscale, origin=(left, top), matcher=self.roi_matcher)
+        if box is None:
+            if cancel is not None and cancel.is_set():
+                return None
+            box = self._match(image_key, frame, confidence, grayscale)
+        if box is not None:
+            self.locations.update(image_key, box)
+        return box
+
+    def _locate_in_roi(self, image_key, confidence=0.9, grayscale=False):
+        """
+        只截取上次出现位置附近的区域查找
+
+        :return: (Box, 截取的区域, 区域截图)，没有位置记录时区域和截图为 None，没找到时 Box 为 None
+        """
+        region = self.locations.region(image_key, self.backend.size())
+        if region is None:
+            return None, None, None
+        frame = self._grab(region)
+        box = self._match(image_key, frame, confidence, grayscale, origin=region[:2], matcher=self.roi_matcher)
+        if box is not None:
+            self.locations.update(image_key, box)
+        return box, region, frame
+
+    def _locate_on_screen(self, image_key, confidence=0.9, grayscale=False):
+        """先只截取上次出现位置附近的区域查找，找不到再截全屏查找"""
+        box, _, _ = self._locate_in_roi(image_key, confidence, grayscale)
+        if box is not None:
+            return box
+        box = self._match(image_key, self._grab(), confidence, grayscale)
+        if box is not None:
+            self.locations.update(image_key, box)
+        return box
 
+    def safe_locate_center(self, image_key, confidence=0.9, grayscale=False, min_search_time=10):
+        start = time.time()
+        while True:
+            box = self._locate_on_screen(image_key, confidence=confidence, grayscale=grayscale)
+            if box is not None:
+                return center(box)
+            if time.time() - start >= min_search_time:
+                logger.error(f"未找到元素: {self.image_paths.get(image_key)}")
+                return None
+
+
+    # 整屏截图每隔几个像素取一个计算 CRC，界面上出现的窗口、模板都比这个间隔大
+    CHANGE_SAMPLE_STEP = 4
+
+    @staticmethod
+    def _checksum(frame, step=1) -> int:
+        """截图的 CRC，step 大于 1 时每隔 step 个像素取一个计算"""
+        if step <= 1:
+            return zlib.crc32(frame)
+        return zlib.crc32(frame[::step, ::step].tobytes())
+
+    def _frame_changes(self, region=None, timeout=2.5, poll_interval=None, checked=None):
+        """
+        截取 region 区域，只有像素发生变化时才产出这一帧，超时后结束
+
+        第一帧总是产出，之后画面不变时不再重复做模板匹配。整屏截图只比较降采样后的像素，
+        模板出现在画面任何位置都能发现，计算量只有原来的几十分之一。
+        截屏间隔从 poll_interval 开始按 poll_growth 逐次放大到 poll_max_interval：
+        界面通常在操作后很快响应，刚开始截得密，越往后越稀。
+
+        :param checked: 调用方已经匹配过的同一区域的截图，作为比较的起点，不再产出
+        """
+        match = get_config().match
+        poll_interval = match.get('poll_interval') if poll_interval is None else poll_interval
+        max_interval = max(match.get('poll_max_interval'), poll_interval)
+        step = self.CHANGE_SAMPLE_STEP if region is None else 1
+        deadline = time.monotonic() + timeout
+        last_checksum = None if checked is None else self._checksum(checked, step)
+        sleep_first = checked is not None
+        while True:
+            if sleep_first:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                time.sleep(min(poll_interval, remaining))
+                poll_interval = min(poll_interval * match.get('poll_growth'), max_interval)
+            sleep_first = True
+            global_pause.wait()
+            frame = self._grab(region)
+            checksum = self._checksum(frame, step)
+            if checksum != last_checksum:
+                last_checksum = checksum
+                yield frame
+
+    def wait_until_appears(self, image_key, timeout=2.5, confidence=0.9, poll_interval=None):
+        """
+        等待模板出现，画面有变化时才重新匹配
+
+        :param timeout: 超时时间（秒），有足够的历史耗时样本时按历史耗时调整，见 _wait_deadline
+        :return: 模板中心点，超时返回 None
+        """
+        global_pause.wait()
+        tracer = get_tracer()
+        timeout = self._wait_deadline([image_key], timeout)
+        with tracer.span(f'appear.{image_key}', timeout=timeout) as span:
+            # 先只截上次出现位置附近，已经在画面上时几毫秒就能返回
+            box, _, _ = self._locate_in_roi(image_key, confidence=confidence)
+            if box is not None:
+                return center(box)
+            # 之后截全屏，第一帧直接做整屏匹配，模板可能出现在别的位置，整个画面有变化就重新匹配
+            for attempt, frame in enumerate(self._frame_changes(timeout=timeout, poll_interval=poll_interval), 1):
+                span.attrs['attempts'] = attempt
+                with tracer.span(f'match.{image_key}'):
+                    box = self._locate_in_frame(image_key, frame, confidence=confidence)
+                if box is not None:
+                    if attempt > 1:
+                        self._record_appearance([image_key])
+                    return center(box)
+            span.attrs['timed_out'] = True
+        logger.info(f"等待 {image_key} 出现超时: {timeout} 秒")
+        return None
+
+    def wait_until_gone(self, image_key, timeout=120, confidence=0.9, poll_interval=None) -> bool:
+        """
+        等待模板消失，只监视模板所在的区域，区域画面有变化时才重新匹配
+
+        :return: 是否已经消失，超时返回 False
+        """
+        global_pause.wait()
+        with get_tracer().span(f'gone.{image_key}', timeout=timeout) as span:
+            box, region, checked = self._locate_in_roi(image_key, confidence=confidence)
+            if box is None:
+                checked = None
+                box = self._match(image_key, self._grab(), confidence)
+                if box is None:
+                    return True
+                self.locations.update(image_key, box)
+                region = self.locations.region(image_key, self.backend.size())
+            origin = region[:2] if region is not None else (0, 0)
+            # 刚截取的区域已经匹配过，从下一次截屏开始比较
+            for attempt, frame in enumerate(self._frame_changes(region, timeout=timeout, poll_interval=poll_interval,
+                                                                checked=checked), 1):
+                span.attrs['attempts'] = attempt
+                if self._match(image_key, frame, confidence, origin=origin, matcher=self.roi_matcher) is None:
+                    return True
+            span.attrs['timed_out'] = True
+        logger.info(f"等待 {image_key} 消失超时: {timeout} 秒")
+        return False
+
+    def _wait_deadline(self, image_keys: list[str], timeout: float) -> float:
+        """
+        等待模板出现的超时时间
+
+        开启 adaptive_wait 且这些模板都有足够的历史样本时，按历史耗时的 p99 扣除距离上次操作已过去的时间，
+        否则使用调用处给的 timeout。timeout 为 0 表示只检测一次，不做调整。
+        """
+        if not timeout or not get_config().match.get('adaptive_wait') or not self.backend.last_input_at:
+            return timeout
+        elapsed = time.monotonic() - self.backend.last_input_at
+        return self.appearance.deadline(image_keys, timeout, elapsed)
+
+    def _record_appearance(self, image_keys: list[str]) -> None:
+        """
+        记录模板从上次点击或键盘输入到出现的耗时
+
+        只在第一次检测没有找到、之后的某一帧才出现时调用，第一次就找到的模板在操作之前可能已经在画面上了
+        """
+        if not self.backend.last_input_at:
+            return
+        elapsed = time.monotonic() - self.backend.last_input_at
+        # 距离上次操作太久说明模板早就在画面上了，不是这次操作引起的
+        if elapsed > self.appearance.max_wait:
+            return
+        for image_key in image_keys:
+            self.appearance.record(image_key, elapsed)
 
-    '''
-        每隔半秒搜索一次图片位置，搜索到就返回
-    '''
     def _find_point(self, image_key: str, retry_times = 5, wait_time=0.5, confidence=0.9):
-        for retry in range(retry_times):
-            global_pause.wait()
-            img_location = self.safe_locate_center(image_key, min_search_time=0, confidence=confidence)
-            if img_location is None:
-                time.sleep(wait_time)
-                continue
-            else:
-                return img_location
+        """
+        等待模板出现，找到就返回
+
+        有历史耗时时按历史耗时等待，否则等待 retry_times * wait_time 秒
+        """
+        return self.wait_until_appears(image_key, timeout=retry_times * wait_time, confidence=confidence)
+
+    def locate_many(self, image_keys: list[str], confidence=0.9, grayscale=False, first_hit=False) -> dict:
+        """
+        只截一次屏，在同一帧上匹配多个模板
+
+        :param image_keys: 模板名称列表
+        :param first_hit: 为 True 时找到任意一个就返回，取消其余未完成的匹配
+        :return: 找到的模板 {模板名称: 中心点}，没找到的不包含在内
+        """
+        return self._locate_many_in_frame(image_keys, self._grab(), confidence=confidence, grayscale=grayscale,
+                                          first_hit=first_hit)
+
+    def _locate_many_in_frame(self, image_keys: list[str], frame, confidence=0.9, grayscale=False,
+                              first_hit=False, required=None) -> dict:
+        """
+        在同一帧上匹配多个模板，配置了线程池时并行匹配
+
+        :param first_hit: 为 True 时 required 中任意一个找到就返回，取消其余未完成的匹配
+        :param required: first_hit 时需要找到的模板，默认为 image_keys 中的任意一个
+        """
+        if grayscale:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        required = image_keys if required is None else required
+        hits = {}
+        if self.match_pool is None or len(image_keys) == 1:
+            for image_key in image_keys:
+                box = self._locate_in_frame(image_key, frame, confidence=confidence, grayscale=grayscale)
+                if box is not None:
+                    hits[image_key] = center(box)
+                    if first_hit and image_key in required:
+                        break
+        else:
+            cancel = threading.Event()
+            futures = {self.match_pool.submit(self._locate_in_frame, image_key, frame, confidence, grayscale,
+                                              cancel): image_key
+                       for image_key in image_keys}
+            try:
+                for future in as_completed(futures):
+                    image_key = futures[future]
+                    box = future.result()
+                    if box is not None:
+                        hits[image_key] = center(box)
+                        if first_hit and image_key in required:
+                            break
+            finally:
+                # 已经有结果时，未开始的直接取消，正在匹配的跳过整屏匹配
+                cancel.set()
+                for future in futures:
+                    future.cancel()
+        logger.debug(f"同帧查找 {image_keys}，找到: {hits}")
+        return hits
+
+    def wait_for_any(self, image_keys: list[str], timeout=2.5, confidence=0.9, required=None, first_hit=False) -> dict:
+        """
+        同时等待多个模板，画面有变化时才重新匹配，required 中任意一个出现就返回本帧的结果
+
+        :param timeout: 超时时间（秒），为 0 时只检测一次，有足够的历史耗时样本时按历史耗时调整
+        :param required: 需要等待出现的模板，默认为 image_keys 中的任意一个
+        :param first_hit: 为 True 时 required 中任意一个找到就返回，不再等待其余模板的匹配结果
+        :return: 找到的模板 {模板名称: 中心点}，超时返回最后一帧的结果
+        """
+        required = image_keys if required is None else required
+        tracer = get_tracer()
+        name = '|'.join(image_keys)
+        hits = {}
+        timeout = self._wait_deadline(required, timeout)
+        with tracer.span(f'appear.{name}', timeout=timeout) as span:
+            for attempt, frame in enumerate(self._frame_changes(timeout=timeout), 1):
+                span.attrs['attempts'] = attempt
+                with tracer.span(f'match.{name}'):
+                    hits = self._locate_many_in_frame(image_keys, frame, confidence=confidence, first_hit=first_hit,
+                                                      required=required)
+                found = [key for key in required if key in hits]
+                if found:
+                    if attempt > 1:
+                        self._record_appearance(found)
+                    return hits
+            span.attrs['timed_out'] = True
+        return hits
 
 
     # 找输入框输入单号
@@ -250,16 +502,71 @@ class InvoiceAutomationWorker:
         searchx, searchy = self._find_point('search_icon', retry_times=20)
         return searchx - 60, searchy
 
+    def input_invoice_no(self, invoice_id, safe=False):
+        """
+        找输入框输入单号进行查询，调用前需要先将远程桌面置于最上层
+
+        :param safe: 为 True 时这一次使用 safe 节奏输入
+        """
+        searchx, searchy = self.find_search_input()
+        self.input.replace_text(searchx, searchy, invoice_id, step='input_invoice_no', safe=safe)
+
     def valid_invoice_id(self, invoice_id):
+        """
+        校验搜索到的单号与需要的是否一致
+
+        verify_mode 为 glyph 且已生成字形图集时直接从截图读取单号，读不出来或者不一致时再用复制粘贴的方式确认
+        :return: (是否一致, 搜索到的单号)
+        """
         global_pause.wait()
-        fhdhx, fhdhy = self._find_point('fahuodanhao', retry_times=6)
-        _invoice_logger.info(f"发货单号的位置: {fhdhx}, {fhdhy}")
-        old_val = pyperclip.paste()
+        anchor = self._find_point('fahuodanhao', retry_times=6)
+        _invoice_logger.info(f"发货单号的位置: {anchor.x}, {anchor.y}")
+        shown = None
+        if get_config().match.get('verify_mode') == 'glyph' and get_glyph_reader().available:
+            with get_tracer().span('verify.glyph') as span:
+                shown = self._read_invoice_id(anchor, invoice_id)
+                span.attrs['result'] = shown
+            if shown == invoice_id:
+                _invoice_logger.info(f"截图读取单号: {shown}")
+                return True, shown
+            # 读错一个字符也会不一致，只相信一致的结果，不一致时用复制的方式确认
+            if shown is None:
+                _invoice_logger.info("截图读取单号失败，改用复制的方式")
+            else:
+                _invoice_logger.info(f"截图读取单号: {shown} 不一致，改用复制的方式确认")
+        with get_tracer().span('verify.clipboard'):
+            return self._copy_invoice_id(anchor, invoice_id, shown)
+
+    def _read_invoice_id(self, anchor, invoice_id, timeout=2.0):
+        """
+        从 fahuodanhao 右侧的单号栏读取单号，单号栏可能还显示着上一个单据，读到一致的或者超时才返回
+
+        :return: 最后读到的单号，一次都没有读出来时返回 None
+        """
+        region = field_region(anchor, get_config().match.get('invoice_field'))
+        reader = get_glyph_reader()
+        shown = None
+        for frame in self._frame_changes(region, timeout=timeout):
+            text = reader.read(frame)
+            if text is not None:
+                shown = text
+                if shown == invoice_id:
+                    break
+        return shown
+
+    def _copy_invoice_id(self, anchor, invoice_id, shown=None):
+        """
+        双击单号栏复制单号，与剪贴板中原来的内容比较
+
+        :param shown: 截图读到的单号，剪贴板一直没有变化时作为搜索到的单号返回
+        :return: (是否一致, 搜索到的单号)
+        """
+        fhdhx, fhdhy = anchor
+        old_val = self.backend.read_clipboard()
         for i in range(20):
-            pyautogui.moveTo(fhdhx + 80, fhdhy, 0.5)
-            pyautogui.doubleClick(fhdhx + 80, fhdhy, interval=0.1)
-            pyautogui.hotkey('ctrl', 'c')
-            new_val = pyperclip.paste()
+            self.input.double_click(fhdhx + 80, fhdhy, step='copy_invoice_id', move=0.5)
+            self.input.hotkey('ctrl', 'c', step='copy_invoice_id')
+            new_val = self.backend.read_clipboard()
             _invoice_logger.info(f"复制结果: {old_val} -> {new_val}")
             log_message(f"复制结果: {old_val} -> {new_val}")
             if old_val == new_val:
@@ -267,210 +574,45 @@ class InvoiceAutomationWorker:
                 continue
             if new_val == invoice_id:
                 return True, new_val
-        return False, old_val
+        # 复制到了新内容时以复制到的为准，否则剪贴板中是原来的内容，用截图读到的
+        if new_val == old_val and shown is not None:
+            return False, shown
+        return False, new_val
 
     def do_process_invoices(self, invoice_id, doc_type) -> ProcessResult:
+        """按 workflow.yaml 中定义的流程处理单据"""
         global _invoice_logger
         global_pause.wait()
         _invoice_logger = LoggerManager().get_invoice_logger(invoice_id)
-        from_path = self.safe_locate_center
         log = _invoice_logger
         log.info(f'单据类型: {doc_type}')
         log_message(f'单据: {invoice_id} 类型: {doc_type}')
         try:
-            # 将远程桌面置于最顶层
-            self.bring_window_to_front()
-
-            def input_invoice_no():
-                self.bring_window_to_front()
-                # 找输入框输入单号进行查询
-                searchx, searchy = self.find_search_input()
-                pyautogui.moveTo(searchx, searchy)
-                pyautogui.doubleClick(searchx, searchy, interval=0.1)
-                pyautogui.sleep(0.2)
-                pyautogui.press('backspace', presses=10, interval=0.1)
-                pyautogui.write(invoice_id, 0.1)  # 输入单号
-                pyautogui.press('enter')
-
-            global_pause.wait()
-            input_invoice_no()
-
-            # 提示找不到则直接返回并记录
-            global_pause.wait()
-            if self._find_point('zbd', retry_times=3):
-                qdlocation = self._find_point('queding')
-                # pyautogui.moveTo(qdlocation.x, qdlocation.y)
-                pyautogui.click(qdlocation.x, qdlocation.y)
-                log.info("提示未找到单据")
-                log_message(f"[{invoice_id}] 提示未找到单据")
-                return ProcessResult.success('提示未找到单据')
-
-
-            # 找到单据 校验单据号是否一致
-            log.info("开始校验单号")
-            log_message("开始校验单号")
-            valid, invoice_no = self.valid_invoice_id(invoice_id)
-            if not valid:
-                msg = f'单号不一致，搜索到的: {invoice_no} 需要的: {invoice_id}'
-                log.info(msg)
-                log_message(msg)
-                return ProcessResult.fail(msg)
-
-            # 找到是否为0 为0则可以打印
-            global_pause.wait()
-            # 同时查找两张图 每0.1秒查找一次 尝试20次 找到立刻返回
-            log_message("开始找左下角0")
-            start = time.time()
-            zero_location = from_path('zero', confidence=0.84, min_search_time=0)
-            zero2_location = from_path('zero2', confidence=0.84, min_search_time=0)
-            log.info(f'左下角0的位置: {zero_location}, {zero2_location}, 耗费时间: {time.time() - start}')
-            log_message(f'左下角0的位置: {zero_location}, {zero2_location}, 耗费时间: {time.time() - start}')
-            if zero_location is None and zero2_location is None:
-                log.info(f'跳过，单据左下角不为0')
-                log_message(f'跳过，单据[{invoice_id}]左下角不为0')
-                return ProcessResult.success(f'单据[{invoice_id}]左下角不为0')
-
-            def shuaxincunliang():
-                global_pause.wait()
-                log_message("开始刷新存量")
-                log.info(f"点击存量")
-                # 点击 存量
-                cunliang_location = self._find_point('cunliang')
-                # pyautogui.moveTo(cunliang_location.x + 24, cunliang_location.y)
-                pyautogui.click(cunliang_location.x + 24, cunliang_location.y)
-
-                log.info(f"存量位置: {cunliang_location.x + 24}, {cunliang_location.y}")
-
-                log.info(f"点击刷新存量")
-                # 点击 刷新表现体存量
-                sx_cunliang_location = self._find_point('shuaxincunliang', retry_times=10)
-                # pyautogui.moveTo(sx_cunliang_location.x, sx_cunliang_location.y)
-                pyautogui.click(sx_cunliang_location.x, sx_cunliang_location.y)
-
-                log.info(f"刷新存量位置: {sx_cunliang_location.x}, {sx_cunliang_location.y}")
-
-            # 找有没有件数字段 没有则勾选完模板再去打印
-            global_pause.wait()
-            log_message("开始找件数")
-            jianshu_location = self._find_point('jianshu', retry_times=2)
-            if jianshu_location is None:
-                log.info(f"没有找到件数，切换模板")
-                log_message(f"没有找到件数，切换模板")
-                bcgs_location = self._find_point('baocungeshi', retry_times=2)
-                if bcgs_location is None:
-                    log.error(f"需要切换模板，根据'保存格式'定位，但是没找到'保存格式'")
-                    log_message(f"[{invoice_id}] 需要切换模板，根据'保存格式'定位，但是没找到'保存格式'")
-                    return ProcessResult.fail("需要切换模板，根据'保存格式'定位，但是没找到'保存格式'")
-                else:
-                    # pyautogui.moveTo(bcgs_location.x, bcgs_location.y + 26)
-                    pyautogui.click(bcgs_location.x, bcgs_location.y + 26)
-                    log.info(f"寻找纸箱打印模板")
-                    zhixiang_location = self._find_point('zhixiang', retry_times=2)
-                    if zhixiang_location is None:
-                        log.info(f"没找到 纸箱打印模板")
-                        log_message(f"[{invoice_id}] 没找到 纸箱打印模板")
-                        return ProcessResult.fail("没找到 纸箱打印模板")
-                    else:
-                        # pyautogui.moveTo(zhixiang_location.x, zhixiang_location.y)
-                        pyautogui.click(zhixiang_location.x, zhixiang_location.y)
-                        log.info(f"选择纸箱打印模板")
-                        log_message(f"选择纸箱打印模板")
-            else:
-                # 点击存量刷新存量
-                shuaxincunliang()
-
-                log.info(f"找到件数")
-                log_message(f"找到件数")
-                # 点击发货单打印模板
-                bcgs_location = self._find_point('baocungeshi', retry_times=2)
-                # pyautogui.moveTo(bcgs_location.x, bcgs_location.y + 26)
-                pyautogui.click(bcgs_location.x, bcgs_location.y + 26)
-                fahuodan_location = self._find_point('fahuodan', retry_times=2)
-                log.info(f"寻找发货单打印模板")
-                if fahuodan_location is None:
-                    log.info(f"没找到 发货单打印模板")
-                    log_message(f"[{invoice_id}] 没找到 发货打印模板")
-                    return ProcessResult.fail("没找到 发货单打印模板")
-                else:
-                    # pyautogui.moveTo(fahuodan_location.x, fahuodan_location.y)
-                    pyautogui.click(fahuodan_location.x, fahuodan_location.y)
-                    log.info(f"选择发货单打印模板")
-                    log_message(f"选择发货单打印模板")
-
-            # 点击 打印
-            global_pause.wait()
-            log_message("点击打印")
-            print_location = self._find_point('print', retry_times=2)
-            if print_location is not None:
-                # pyautogui.moveTo(print_location.x, print_location.y)
-                pyautogui.click(print_location.x, print_location.y)
-
-                # 再次点击 打印 打印机执行打印操作
-                dayin_location = self._find_point('dayin', 5)
-                if dayin_location is not None:
-                    # pyautogui.moveTo(dayin_location.x, dayin_location.y)
-                    # 打印
-                    # pyautogui.click(dayin_location.x, dayin_location.y)
-                    # 循环等待打印窗口消失后再继续
-                    while True:
-                        dayin_location = from_path('dayin', min_search_time=0)
-                        if dayin_location is None:
-                            return ProcessResult.success('已打印')
-                        else:
-                            # 找一张图片大约花费在 0.3 - 0.4 这里每次休眠0.2节省cpu性能
-                            time.sleep(0.2)
-
-                # 点击不再弹出
-                bztc_location = self._find_point('buzaitanchu', retry_times=1)
-                if bztc_location is not None:
-                    # pyautogui.moveTo(bztc_location.x, bztc_location.y)
-                    pyautogui.click(bztc_location.x, bztc_location.y)
-                    # 点击 确定
-                    quedingdayin_location = self._find_point('quedingdayin', retry_times=2)
-                    if quedingdayin_location is not None:
-                        # pyautogui.moveTo(quedingdayin_location.x, quedingdayin_location.y)
-                        pyautogui.click(quedingdayin_location.x, quedingdayin_location.y)
-
-
-            # 再次点击 打印 打印机执行打印操作
-            dayin_location = self._find_point('dayin', 5)
-            if dayin_location is not None:
-                # pyautogui.moveTo(dayin_location.x, dayin_location.y)
-                # 打印
-                pyautogui.click(dayin_location.x, dayin_location.y)
-                # 循环等待打印窗口消失后再继续
-                while True:
-                    dayin_location = from_path('dayin', min_search_time=0)
-                    if dayin_location is None:
-                        return ProcessResult.success('已打印')
-                    else:
-                        # 找一张图片大约花费在 0.3 - 0.4 这里每次休眠0.2节省cpu性能
-                        time.sleep(0.2)
-            else:
-                log.info(f"点击打印失败，没有找到打印按钮")
-                log_message(f"点击打印失败，没有找到打印按钮")
-
-                # 不能打印的发微信通知 跳过此单
-                global_pause.wait()
-                buneng_location = from_path('buneng')
-                if buneng_location is not None:
-                    # 找到提示的确定按钮
-                    bn_qd_location = from_path('queding')
-                    if bn_qd_location is not None:
-                        pyautogui.moveTo(bn_qd_location.x, bn_qd_location.y, 1)
-                        pyautogui.click(bn_qd_location.x, bn_qd_location.y)
-                    self.wechat_client.send_msg(f'不能打印{invoice_id}', get_config().base.notify_user)
-                    log.info("系统提示不能打印")
-                    log_message(f"系统提示不能打印: {invoice_id}")
-                    return ProcessResult.success('系统提示不能打印')
-
-
+            status, reason = self.workflow.run(invoice_id, doc_type, log)
+            return ProcessResult.success(reason) if status == SUCCESS else ProcessResult.fail(reason)
         except Exception as e:
             log.error(f"脚本执行失败: {e}")
             log_message(f"脚本执行失败: {invoice_id}, 原因: {e}")
             self.wechat_client.send_msg(f'脚本执行失败，单号: {invoice_id}', get_config().base.notify_user)
             return ProcessResult.fail(str(e))
-        return ProcessResult.success()
 
 if __name__ == '__main__':
-    pass
+    # 在录制的截图上回放处理流程: python -m wechatv3.process_invoice <截图目录> <单据号> [单据类型]
+    import sys
+    from wechatv3.screen_backend import ReplayBackend
+
+    class _LogOnlyClient:
+        def send_msg(self, content, who):
+            logger.info(f"[回放] 发送微信消息: [{who}]-->{content}")
+
+    global_pause.set()
+    replay_invoice_id = sys.argv[2]
+    replay_backend = ReplayBackend(sys.argv[1], advance=get_config().base.replay_advance, clipboard=replay_invoice_id)
+    replay_worker = InvoiceAutomationWorker(_LogOnlyClient(), replay_backend)
+    replay_start = time.time()
+    with get_tracer().trace(replay_invoice_id, replay=True):
+        replay_result = replay_worker.do_process_invoices(replay_invoice_id, sys.argv[3] if len(sys.argv) > 3 else '发货单')
+    logger.info(f"回放结果: {replay_result}，耗时 {time.time() - replay_start:.3f} 秒，"
+                f"输入事件 {len(replay_backend.events)} 个")
+    get_tracer().log_summary()
+    replay_worker.appearance.save()
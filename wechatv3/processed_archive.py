@@ -0,0 +1,161 @@
+import csv
+import glob
+import io
+import os
+import threading
+from datetime import datetime
+
+from wechatv3.common import get_config
+from wechatv3.invoice_queue import read_csv_rows
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+PROCESSED_HEADER = ["编号", "类型", "时间", "联系人", "状态", "原始消息", "原因"]
+
+
+class ProcessedArchive:
+    """
+    按月分段的已处理记录
+
+    每个月一个 CSV 分段 (YYYYMM.csv)，可以直接用 Excel 打开；
+    旁边的 YYYYMM.idx 每行记录 "单号,字节位置"，按单号查找时只读索引再直接定位到那一行。
+    写入只追加到当前月份的分段，历史记录不再被截断。
+    """
+
+    def __init__(self, archive_dir: str, segment_format: str = '%Y%m'):
+        """
+        :param archive_dir: 归档目录
+        :param segment_format: 分段文件名的时间格式，%Y%m 按月，%Y%m%d 按天
+        """
+        self.archive_dir = archive_dir
+        self.segment_format = segment_format
+        self._lock = threading.Lock()
+        self._indexes: dict[str, dict[str, list[int]]] = {}  # 分段名称 -> 单号 -> 字节位置
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def _segment_name(self, timestamp: str) -> str:
+        return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime(self.segment_format)
+
+    def _paths(self, segment: str) -> tuple[str, str]:
+        base = os.path.join(self.archive_dir, segment)
+        return base + '.csv', base + '.idx'
+
+    def segments(self) -> list[str]:
+        """全部分段名称，按时间从早到晚"""
+        return sorted(os.path.splitext(os.path.basename(path))[0]
+                      for path in glob.glob(os.path.join(self.archive_dir, '*.csv')))
+
+    @staticmethod
+    def _encode(row: list) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow(row)
+        return buffer.getvalue().encode('utf-8')
+
+    def append(self, row: list[str]) -> None:
+        """追加一条已处理记录 [编号, 类型, 时间, 联系人, 状态, 原始消息, 原因]，按时间写入对应的分段"""
+        invoice_id, timestamp = row[0], row[2]
+        segment = self._segment_name(timestamp)
+        csv_path, idx_path = self._paths(segment)
+        with self._lock:
+            with open(csv_path, 'ab') as f:
+                if f.tell() == 0:
+                    f.write('\ufeff'.encode('utf-8') + self._encode(PROCESSED_HEADER))
+                offset = f.tell()
+                f.write(self._encode(row))
+            with open(idx_path, 'a', encoding='utf-8') as f:
+                f.write(f"{invoice_id},{offset}\n")
+            # 已经加载过的索引同步更新
+            index = self._indexes.get(segment)
+            if index is not None:
+                index.setdefault(invoice_id, []).append(offset)
+
+    def _index(self, segment: str) -> dict[str, list[int]]:
+        index = self._indexes.get(segment)
+        if index is None:
+            index = {}
+            _, idx_path = self._paths(segment)
+            if os.path.exists(idx_path):
+                with open(idx_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        invoice_id, _, offset = line.strip().rpartition(',')
+                        if invoice_id:
+                            index.setdefault(invoice_id, []).append(int(offset))
+            self._indexes[segment] = index
+        return index
+
+    def _read_at(self, segment: str, offsets: list[int]) -> list[list[str]]:
+        csv_path, _ = self._paths(segment)
+        rows = []
+        with open(csv_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                rows.extend(csv.reader([f.readline().decode('utf-8')]))
+        return rows
+
+    def find(self, invoice_id: str) -> list[list[str]]:
+        """按单号查找全部处理记录，从最近的分段开始只读取各分段的索引"""
+        rows = []
+        with self._lock:
+            for segment in reversed(self.segments()):
+                offsets = self._index(segment).get(invoice_id)
+                if offsets:
+                    rows = self._read_at(segment, offsets) + rows
+        return rows
+
+    def between(self, start: str, end: str) -> list[list[str]]:
+        """
+        查找时间范围内的处理记录，只读取范围内的分段
+
+        :param start: 开始日期 YYYY-MM-DD
+        :param end: 结束日期 YYYY-MM-DD（包含当天）
+        """
+        start_time, end_time = f"{start} 00:00:00", f"{end} 23:59:59"
+        first, last = self._segment_name(start_time), self._segment_name(end_time)
+        rows = []
+        for segment in self.segments():
+            if first <= segment <= last:
+                csv_path, _ = self._paths(segment)
+                rows.extend(row for row in read_csv_rows(csv_path) if start_time <= row[2] <= end_time)
+        return rows
+
+    def import_csv(self, csv_file: str) -> int:
+        """导入旧版本的已处理 CSV，时间无法识别的记录放入导入当天的分段"""
+        rows = read_csv_rows(csv_file)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for row in rows:
+            row = (row + [''] * len(PROCESSED_HEADER))[:len(PROCESSED_HEADER)]
+            try:
+                self._segment_name(row[2])
+            except ValueError:
+                row[2] = now
+            self.append(row)
+        return len(rows)
+
+
+# 全局单例实例
+_archive_instance: ProcessedArchive | None = None
+
+def get_processed_archive() -> ProcessedArchive:
+    global _archive_instance
+    if _archive_instance is None:
+        base = get_config().base
+        is_new = not os.path.exists(base.processed_archive_path)
+        _archive_instance = ProcessedArchive(base.processed_archive_path, base.get('processed_segment_format'))
+        # 第一次使用时导入旧版本的已处理文件，旧文件保留不再写入
+        processed_file = os.path.join(base.processed_path, base.processed_file_name)
+        if is_new and os.path.exists(processed_file):
+            count = _archive_instance.import_csv(processed_file)
+            logger.info(f"已从 {processed_file} 导入 {count} 条已处理记录到 {base.processed_archive_path}")
+    return _archive_instance
+
+
+if __name__ == '__main__':
+    # 查询已处理记录: python -m wechatv3.processed_archive <单号> 或 <开始日期> <结束日期>
+    import sys
+
+    archive = get_processed_archive()
+    found = archive.find(sys.argv[1]) if len(sys.argv) == 2 else archive.between(sys.argv[1], sys.argv[2])
+    for found_row in found:
+        print(','.join(found_row))
+    logger.info(f"共 {len(found)} 条记录")
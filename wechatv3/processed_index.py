@@ -0,0 +1,78 @@
+import os
+import threading
+
+from wechatv3.common import get_config
+from wechatv3.invoice_queue import read_csv_rows
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class ProcessedIndex:
+    """
+    已处理单号的去重索引
+
+    单号按处理顺序每行一个追加到文件，启动时整体读入集合，之后每处理完一个单据追加一行。
+    单号约 12 字节，几个月的单号也只有几百 KB，查询是集合查找，不受已处理文件只保留 200 行的影响。
+    """
+
+    def __init__(self, index_file: str):
+        self.index_file = index_file
+        self._ids: set[str] = set()
+        self._last = ''
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                invoice_id = line.strip()
+                if invoice_id:
+                    self._ids.add(invoice_id)
+                    self._last = invoice_id
+        logger.info(f"已加载已处理单号: {len(self._ids)} 个")
+
+    def add(self, invoice_id: str) -> None:
+        """记录处理完的单号"""
+        with self._lock:
+            self._last = invoice_id
+            if invoice_id in self._ids:
+                return
+            self._ids.add(invoice_id)
+            directory = os.path.dirname(self.index_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(invoice_id + '\n')
+
+    def last(self) -> str:
+        """最后处理的单号"""
+        return self._last
+
+    def __contains__(self, invoice_id: str) -> bool:
+        return invoice_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+# 全局单例实例
+_index_instance: ProcessedIndex | None = None
+
+def get_processed_index() -> ProcessedIndex:
+    global _index_instance
+    if _index_instance is None:
+        base = get_config().base
+        index_file = os.path.join(base.processed_path, base.processed_index_name)
+        is_new = not os.path.exists(index_file)
+        _index_instance = ProcessedIndex(index_file)
+        # 第一次使用时从已处理文件导入
+        processed_file = os.path.join(base.processed_path, base.processed_file_name)
+        if is_new and os.path.exists(processed_file):
+            rows = read_csv_rows(processed_file)
+            for row in rows:
+                _index_instance.add(row[0])
+            logger.info(f"已从 {processed_file} 导入 {len(rows)} 个已处理单号")
+    return _index_instance
@@ -0,0 +1,212 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class ResultLog:
+    """
+    按天保存的处理结果
+
+    每天一个 YYYYMMDD.jsonl，每行一条 JSON 结果；旁边的 YYYYMMDD.idx 每行记录 "单号,字节位置"，
+    按单号查找时只读索引再直接定位到那一行。写入由后台线程完成，处理线程只把结果放入队列，
+    后台线程一次取出队列中的全部结果合并写入。需要旧版本每个单据一个 txt 的格式时用 export_txt 导出。
+    """
+
+    def __init__(self, result_dir: str):
+        self.result_dir = result_dir
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._indexes: dict[str, dict[str, list[int]]] = {}  # 日期 -> 单号 -> 字节位置
+        self._writer: threading.Thread | None = None
+        os.makedirs(result_dir, exist_ok=True)
+
+    def _paths(self, day: str) -> tuple[str, str]:
+        base = os.path.join(self.result_dir, day)
+        return base + '.jsonl', base + '.idx'
+
+    def days(self) -> list[str]:
+        """全部有结果的日期，按时间从早到晚"""
+        return sorted(name[:-len('.jsonl')] for name in os.listdir(self.result_dir) if name.endswith('.jsonl'))
+
+    def day_file(self, day: str | None = None) -> str:
+        """某天的结果文件路径，默认当天"""
+        return self._paths(day or datetime.now().strftime("%Y%m%d"))[0]
+
+    def write(self, invoice_id: str, doc_type: str, received_at: str, duration: int, status: str, reason: str,
+              raw_message: str) -> None:
+        """记录一个单据的处理结果，实际写入在后台线程中完成"""
+        now = datetime.now()
+        entry = {
+            'invoice_id': invoice_id,
+            'doc_type': doc_type,
+            'received_at': received_at,
+            'finished_at': now.strftime("%Y-%m-%d %H:%M:%S"),
+            'duration': duration,
+            'status': status,
+            'reason': '' if reason is None else str(reason),
+            'raw_message': raw_message,
+        }
+        self._start_writer()
+        self._queue.put((now.strftime("%Y%m%d"), entry))
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='result-log', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            # 一次取出队列中已有的全部结果，合并写入
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._append(items)
+            except Exception as e:
+                logger.error(f"写入处理结果失败: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _append(self, items: list[tuple[str, dict]]) -> None:
+        by_day: dict[str, list[dict]] = {}
+        for day, entry in items:
+            by_day.setdefault(day, []).append(entry)
+        with self._lock:
+            for day, entries in by_day.items():
+                jsonl_path, idx_path = self._paths(day)
+                offsets = []
+                with open(jsonl_path, 'ab') as f:
+                    for entry in entries:
+                        offsets.append((entry['invoice_id'], f.tell()))
+                        f.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+                with open(idx_path, 'a', encoding='utf-8') as f:
+                    f.writelines(f"{invoice_id},{offset}\n" for invoice_id, offset in offsets)
+                # 已经加载过的索引同步更新
+                index = self._indexes.get(day)
+                if index is not None:
+                    for invoice_id, offset in offsets:
+                        index.setdefault(invoice_id, []).append(offset)
+
+    def flush(self) -> None:
+        """等待队列中的结果全部写入"""
+        self._queue.join()
+
+    def _index(self, day: str) -> dict[str, list[int]]:
+        index = self._indexes.get(day)
+        if index is None:
+            index = {}
+            _, idx_path = self._paths(day)
+            if os.path.exists(idx_path):
+                with open(idx_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        invoice_id, _, offset = line.strip().rpartition(',')
+                        if invoice_id:
+                            index.setdefault(invoice_id, []).append(int(offset))
+            self._indexes[day] = index
+        return index
+
+    def find(self, invoice_id: str) -> list[dict]:
+        """按单号查找全部处理结果，从最近的一天开始只读取各天的索引"""
+        self.flush()
+        entries = []
+        with self._lock:
+            for day in reversed(self.days()):
+                offsets = self._index(day).get(invoice_id)
+                if not offsets:
+                    continue
+                jsonl_path, _ = self._paths(day)
+                found = []
+                with open(jsonl_path, 'rb') as f:
+                    for offset in offsets:
+                        f.seek(offset)
+                        found.append(json.loads(f.readline()))
+                entries = found + entries
+        return entries
+
+    def read_day(self, day: str) -> list[dict]:
+        """某天的全部处理结果"""
+        self.flush()
+        jsonl_path, _ = self._paths(day)
+        if not os.path.exists(jsonl_path):
+            return []
+        with open(jsonl_path, 'rb') as f:
+            return [json.loads(line) for line in f if line.endswith(b'\n')]
+
+    @staticmethod
+    def format_text(entry: dict) -> str:
+        """旧版本 txt 结果文件的内容"""
+        return (
+            f"单据号: {entry['invoice_id']}\n"
+            f"单据类型: {entry['doc_type']}\n"
+            f"处理开始时间: {entry['finished_at']}\n"
+            f"处理时长: {entry['duration']} 秒\n"
+            f"状态: {entry['status']}\n"
+            f"备注信息: {entry['reason']}\n"
+            f"源消息: {entry['raw_message']}\n"
+        )
+
+    def export_txt(self, day: str, out_dir: str | None = None) -> int:
+        """
+        把某天的结果导出为旧版本的格式: <out_dir>/YYYYMMDD/<单号>_<接收时间>.txt
+
+        :param day: 日期 YYYYMMDD
+        :param out_dir: 导出目录，默认为结果目录
+        :return: 导出的文件数
+        """
+        entries = self.read_day(day)
+        day_dir = os.path.join(out_dir or self.result_dir, day)
+        os.makedirs(day_dir, exist_ok=True)
+        for entry in entries:
+            try:
+                time_part = datetime.strptime(entry['received_at'], "%Y-%m-%d %H:%M:%S").strftime("%H%M%S")
+            except ValueError:
+                time_part = entry['finished_at'][-8:].replace(':', '')
+            with open(os.path.join(day_dir, f"{entry['invoice_id']}_{time_part}.txt"), 'w', encoding='utf-8') as f:
+                f.write(self.format_text(entry))
+        return len(entries)
+
+
+# 全局单例实例
+_result_log_instance: ResultLog | None = None
+
+def get_result_log() -> ResultLog:
+    global _result_log_instance
+    if _result_log_instance is None:
+        _result_log_instance = ResultLog(get_config().base.base_result_dir)
+    return _result_log_instance
+
+
+if __name__ == '__main__':
+    # 查询处理结果: python -m wechatv3.result_log --find <单号>
+    # 导出旧版本 txt: python -m wechatv3.result_log --export-txt <YYYYMMDD> [<YYYYMMDD> ...] [--out <目录>]
+    import argparse
+
+    parser = argparse.ArgumentParser(description='按天保存的处理结果')
+    parser.add_argument('--find', metavar='单号', help='按单号查找处理结果')
+    parser.add_argument('--export-txt', nargs='+', metavar='YYYYMMDD', help='导出为每个单据一个 txt 的旧格式')
+    parser.add_argument('--out', help='txt 导出目录，默认为结果目录')
+    args = parser.parse_args()
+
+    result_log = get_result_log()
+    if args.find:
+        for found_entry in result_log.find(args.find):
+            print(json.dumps(found_entry, ensure_ascii=False))
+    for export_day in args.export_txt or []:
+        count = result_log.export_txt(export_day, args.out)
+        logger.info(f"{export_day} 已导出 {count} 个结果文件")
+    if not args.find and not args.export_txt:
+        parser.print_help()
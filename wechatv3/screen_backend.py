@@ -0,0 +1,232 @@
+import glob
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class ScreenBackend:
+    """截屏和键鼠输入的接口，InvoiceAutomationWorker 只通过它操作屏幕"""
+
+    name = ''
+    last_input_at = 0.0  # 最近一次点击或键盘输入的时间（time.monotonic），用于统计界面响应耗时
+
+    def _input_done(self) -> None:
+        self.last_input_at = time.monotonic()
+
+    def screenshot(self, region=None) -> np.ndarray:
+        """
+        截屏
+
+        :param region: (left, top, width, height)，为空则截全屏
+        :return: OpenCV 的 BGR 数组
+        """
+        raise NotImplementedError
+
+    def size(self) -> tuple[int, int]:
+        """屏幕大小 (width, height)"""
+        raise NotImplementedError
+
+    def click(self, x, y) -> None:
+        raise NotImplementedError
+
+    def double_click(self, x, y, interval=0.0) -> None:
+        raise NotImplementedError
+
+    def move_to(self, x, y, duration=0.0) -> None:
+        raise NotImplementedError
+
+    def press(self, key, presses=1, interval=0.0) -> None:
+        raise NotImplementedError
+
+    def write(self, text, interval=0.0) -> None:
+        raise NotImplementedError
+
+    def hotkey(self, *keys) -> None:
+        raise NotImplementedError
+
+    def focus_window(self, title) -> None:
+        """把指定标题的窗口置于最上层，找不到窗口时抛出异常"""
+        raise NotImplementedError
+
+    def read_clipboard(self) -> str:
+        raise NotImplementedError
+
+    def set_pause(self, seconds: float) -> None:
+        """每个键鼠操作之后的停顿，不支持的实现忽略"""
+
+
+class PyAutoGuiBackend(ScreenBackend):
+    """生产环境使用的 pyautogui + pywinauto 实现"""
+
+    name = 'pyautogui'
+
+    def __init__(self):
+        import pyautogui
+        import pyperclip
+        from pywinauto import Application
+
+        self._pyautogui = pyautogui
+        self._pyperclip = pyperclip
+        self._application = Application
+        pyautogui.FAILSAFE = False
+
+    def screenshot(self, region=None):
+        return cv2.cvtColor(np.asarray(self._pyautogui.screenshot(region=region)), cv2.COLOR_RGB2BGR)
+
+    def size(self):
+        return tuple(self._pyautogui.size())
+
+    def click(self, x, y):
+        self._pyautogui.click(x, y)
+        self._input_done()
+
+    def double_click(self, x, y, interval=0.0):
+        self._pyautogui.doubleClick(x, y, interval=interval)
+        self._input_done()
+
+    def move_to(self, x, y, duration=0.0):
+        self._pyautogui.moveTo(x, y, duration)
+
+    def press(self, key, presses=1, interval=0.0):
+        self._pyautogui.press(key, presses=presses, interval=interval)
+        self._input_done()
+
+    def write(self, text, interval=0.0):
+        self._pyautogui.write(text, interval)
+        self._input_done()
+
+    def hotkey(self, *keys):
+        self._pyautogui.hotkey(*keys)
+        self._input_done()
+
+    def focus_window(self, title):
+        app = self._application().connect(title=title)
+        window = app.window(title=title)
+        window.set_focus()  # 设置窗口为最上层
+
+    def read_clipboard(self):
+        return self._pyperclip.paste()
+
+    def set_pause(self, seconds):
+        self._pyautogui.PAUSE = seconds
+
+
+class ReplayBackend(ScreenBackend):
+    """
+    无界面的回放实现，用于在 Linux 上对识别和流程做性能分析
+
+    截屏按文件名顺序返回录制目录中的图片，键鼠输入只记录不执行，
+    ctrl+c 之后剪贴板内容变为 clipboard。
+    advance='input' 时每次输入后切换到下一帧（模拟操作后界面变化），
+    advance='capture' 时每次截屏都切换到下一帧，停在最后一帧。
+    """
+
+    name = 'replay'
+
+    def __init__(self, frames_dir: str, advance: str = 'input', clipboard: str = ''):
+        """
+        :param frames_dir: 录制的截图目录
+        :param advance: 切换帧的时机，input / capture
+        :param clipboard: 按下 ctrl+c 后剪贴板的内容
+        """
+        if advance not in ('input', 'capture'):
+            raise ValueError(f"不支持的切换方式: {advance}")
+        self.frame_paths = sorted(glob.glob(os.path.join(frames_dir, '*.png')))
+        if not self.frame_paths:
+            raise FileNotFoundError(f"回放目录中没有截图: {frames_dir}")
+        self.advance = advance
+        self.clipboard = clipboard
+        self._clipboard = ''
+        self.events: list[tuple[float, str, tuple]] = []
+        self._frames: dict[int, np.ndarray] = {}
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def _frame(self) -> np.ndarray:
+        index = self._index
+        frame = self._frames.get(index)
+        if frame is None:
+            path = self.frame_paths[index]
+            frame = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self._frames[index] = frame
+        return frame
+
+    def _next_frame(self) -> None:
+        self._index = min(self._index + 1, len(self.frame_paths) - 1)
+
+    def _record(self, action: str, *args) -> None:
+        with self._lock:
+            self.events.append((time.time(), action, args))
+            logger.debug(f"[回放] {action} {args}")
+            self._input_done()
+            if self.advance == 'input':
+                self._next_frame()
+
+    def screenshot(self, region=None):
+        with self._lock:
+            frame = self._frame()
+            if self.advance == 'capture':
+                self._next_frame()
+        if region is None:
+            return frame
+        left, top, width, height = region
+        return np.ascontiguousarray(frame[top:top + height, left:left + width])
+
+    def size(self):
+        with self._lock:
+            frame = self._frame()
+        return frame.shape[1], frame.shape[0]
+
+    def click(self, x, y):
+        self._record('click', x, y)
+
+    def double_click(self, x, y, interval=0.0):
+        self._record('double_click', x, y)
+
+    def move_to(self, x, y, duration=0.0):
+        # 移动鼠标不会改变界面，只记录不切换帧
+        with self._lock:
+            self.events.append((time.time(), 'move_to', (x, y)))
+
+    def press(self, key, presses=1, interval=0.0):
+        self._record('press', key, presses)
+
+    def write(self, text, interval=0.0):
+        self._record('write', text)
+
+    def hotkey(self, *keys):
+        if keys == ('ctrl', 'c'):
+            self._clipboard = self.clipboard
+        self._record('hotkey', *keys)
+
+    def focus_window(self, title):
+        with self._lock:
+            self.events.append((time.time(), 'focus_window', (title,)))
+
+    def read_clipboard(self):
+        return self._clipboard
+
+
+# 全局单例实例
+_backend_instance: ScreenBackend | None = None
+
+def get_backend() -> ScreenBackend:
+    global _backend_instance
+    if _backend_instance is None:
+        base = get_config().base
+        name = base.get('backend')
+        if name == ReplayBackend.name:
+            _backend_instance = ReplayBackend(base.get('replay_dir'), advance=base.get('replay_advance'))
+        elif name == PyAutoGuiBackend.name:
+            _backend_instance = PyAutoGuiBackend()
+        else:
+            raise ValueError(f"不支持的屏幕后端: {name}")
+    return _backend_instance
@@ -1,6 +1,66 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 from typing import Dict, Any, Optional, List
 
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class ConnectionManager:
+    """
+    每个线程每个数据库一个长期保持的连接
+
+    连接第一次创建时设置 WAL、synchronous=NORMAL、缓存大小等 pragma，之后一直复用，
+    sqlite3 会按 SQL 文本缓存编译好的语句，同一连接上重复执行相同的 SQL 不需要重新编译。
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",  # WAL 模式下断电最多丢失最后的事务，不会损坏数据库
+        "PRAGMA cache_size=-8000",  # 8MB 页缓存
+        "PRAGMA busy_timeout=5000",  # 其他线程写入时最多等待 5 秒
+    )
+
+    def __init__(self, cached_statements: int = 256):
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: list[sqlite3.Connection] = []
+
+    def get(self, db_path: str) -> sqlite3.Connection:
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get(db_path)
+        if connection is None:
+            # isolation_level=None 为自动提交，需要事务时显式 BEGIN；
+            # 连接只在创建它的线程中使用，check_same_thread=False 只是为了退出时能在主线程中关闭
+            connection = sqlite3.connect(db_path, isolation_level=None, cached_statements=self.cached_statements,
+                                         check_same_thread=False)
+            for pragma in self.PRAGMAS:
+                connection.execute(pragma)
+            connections[db_path] = connection
+            with self._lock:
+                self._all.append(connection)
+            logger.debug(f"[{threading.current_thread().name}] 已连接数据库: {db_path}")
+        return connection
+
+    def close_all(self) -> None:
+        """关闭所有线程的连接，程序退出时调用"""
+        with self._lock:
+            connections, self._all = self._all, []
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error as e:
+                logger.warning(f"关闭数据库连接失败: {e}")
+        self._local = threading.local()
+
+
+_connections = ConnectionManager()
+
 
 class SQLiteTool:
     def __init__(self, db_path: str = ':memory:'):
@@ -14,19 +74,23 @@ class SQLiteTool:
         self.cursor = None
 
     def connect(self) -> None:
-        """连接到数据库"""
+        """获取当前线程到数据库的连接，连接会被复用，不会每次重新打开"""
         try:
-            self.connection = sqlite3.connect(self.db_path, autocommit=True)
+            self.connection = _connections.get(self.db_path)
             self.cursor = self.connection.cursor()
-            print(f"成功连接到数据库: {self.db_path}")
         except sqlite3.Error as e:
-            print(f"连接数据库失败: {e}")
+            logger.error(f"连接数据库失败: {self.db_path}, {e}")
 
     def close(self) -> None:
-        """关闭数据库连接"""
-        if self.connection:
-            self.connection.close()
-            print("数据库连接已关闭")
+        """释放游标，连接保留给当前线程之后使用"""
+        if self.cursor:
+            self.cursor.close()
+            self.cursor = None
+
+    @staticmethod
+    def close_all() -> None:
+        """关闭所有保持的连接"""
+        _connections.close_all()
 
     def execute(self, sql: str, params: Optional[tuple] = None) -> None:
         """
@@ -36,14 +100,15 @@ class SQLiteTool:
         :param params: 参数元组
         """
         try:
+            # 连接为自动提交，事务内的语句由 transaction() 统一提交
             if params:
                 self.cursor.execute(sql, params)
             else:
                 self.cursor.execute(sql)
-            self.connection.commit()
         except sqlite3.Error as e:
-            print(f"执行SQL失败: {e}")
-            self.connection.rollback()
+            logger.error(f"执行SQL失败: {e}, {sql}")
+            if self.connection.in_transaction:
+                raise
 
     def executemany(self, sql: str, params_list: List[tuple]) -> None:
         """
@@ -54,10 +119,29 @@ class SQLiteTool:
         """
         try:
             self.cursor.executemany(sql, params_list)
-            self.connection.commit()
         except sqlite3.Error as e:
-            print(f"批量执行SQL失败: {e}")
+            logger.error(f"批量执行SQL失败: {e}, {sql}")
+            if self.connection.in_transaction:
+                raise
+
+    @contextmanager
+    def transaction(self):
+        """
+        显式事务，块内的全部写入一次提交，块内出错时整体回滚并抛出异常
+
+        已经在事务中时（嵌套调用）不再开启新事务，由最外层提交
+        """
+        if self.connection.in_transaction:
+            yield self
+            return
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
             self.connection.rollback()
+            raise
+        else:
+            self.connection.commit()
 
     def fetchone(self, sql: str, params: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
         """
@@ -80,7 +164,7 @@ class SQLiteTool:
                 return dict(zip(columns, row))
             return None
         except sqlite3.Error as e:
-            print(f"查询单条记录失败: {e}")
+            logger.error(f"查询单条记录失败: {e}, {sql}")
             return None
 
     def fetchall(self, sql: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
@@ -102,7 +186,7 @@ class SQLiteTool:
 
             return [dict(zip(columns, row)) for row in rows]
         except sqlite3.Error as e:
-            print(f"查询多条记录失败: {e}")
+            logger.error(f"查询多条记录失败: {e}, {sql}")
             return []
 
     def create_table(self, table_name: str, columns: Dict[str, str]) -> None:
@@ -132,9 +216,36 @@ class SQLiteTool:
             self.execute(sql, tuple(data.values()))
             return self.cursor.lastrowid
         except sqlite3.Error as e:
-            print(f"插入记录失败: {e}")
+            logger.error(f"插入记录失败: {e}")
+            if self.connection.in_transaction:
+                raise
             return None
 
+    def upsert_many(self, table_name: str, rows: List[Dict[str, Any]], key: str = 'id') -> int:
+        """
+        批量插入或更新记录，主键已存在时更新其他字段，全部记录在一个事务中提交
+
+        :param table_name: 表名
+        :param rows: 数据字典列表，字段与第一条一致
+        :param key: 冲突判断的主键或唯一字段
+        :return: 写入的行数，失败时为0
+        """
+        if not rows:
+            return 0
+        columns = list(rows[0].keys())
+        placeholders = ', '.join(['?'] * len(columns))
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != key)
+        conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) ON CONFLICT({key}) {conflict}"
+
+        try:
+            with self.transaction():
+                self.executemany(sql, [tuple(row[column] for column in columns) for row in rows])
+            return len(rows)
+        except sqlite3.Error as e:
+            logger.error(f"批量写入记录失败: {e}")
+            return 0
+
     def update(self, table_name: str, data: Dict[str, Any], condition: str, params: tuple = ()) -> int:
         """
         更新记录
@@ -152,7 +263,9 @@ class SQLiteTool:
             self.execute(sql, tuple(data.values()) + params)
             return self.cursor.rowcount
         except sqlite3.Error as e:
-            print(f"更新记录失败: {e}")
+            logger.error(f"更新记录失败: {e}")
+            if self.connection.in_transaction:
+                raise
             return 0
 
     def delete(self, table_name: str, condition: str, params: tuple = ()) -> int:
@@ -170,7 +283,9 @@ class SQLiteTool:
             self.execute(sql, params)
             return self.cursor.rowcount
         except sqlite3.Error as e:
-            print(f"删除记录失败: {e}")
+            logger.error(f"删除记录失败: {e}")
+            if self.connection.in_transaction:
+                raise
             return 0
 
     def __enter__(self):
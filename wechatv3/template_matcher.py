@@ -0,0 +1,145 @@
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from wechatv3.common import get_config
+
+# 与 pyautogui (pyscreeze) 返回的 Box、Point 字段一致，调用方可以直接使用 .x .y 或者解包
+Box = namedtuple('Box', 'left top width height')
+Point = namedtuple('Point', 'x y')
+
+
+def center(box: Box) -> Point:
+    return Point(box.left + box.width // 2, box.top + box.height // 2)
+
+
+class TemplateMatcher:
+    """模板匹配引擎，haystack 和 needle 都是通道数一致的 OpenCV 数组"""
+
+    name = ''
+
+    def locate(self, haystack: np.ndarray, needle: np.ndarray, confidence: float = 0.9) -> Box | None:
+        raise NotImplementedError
+
+
+class OpenCVMatcher(TemplateMatcher):
+    """原分辨率单次匹配，与 pyautogui 的 confidence 匹配方式相同"""
+
+    name = 'opencv'
+
+    def locate(self, haystack, needle, confidence=0.9):
+        needle_h, needle_w = needle.shape[:2]
+        if haystack.shape[0] < needle_h or haystack.shape[1] < needle_w:
+            return None
+        result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if max_val < confidence:
+            return None
+        return Box(max_loc[0], max_loc[1], needle_w, needle_h)
+
+
+class PyramidMatcher(TemplateMatcher):
+    """
+    由粗到细的金字塔匹配
+
+    先在缩小后的截图上找出几个最可能的位置，再只在这些位置附近按原分辨率精确匹配。
+    整屏查找时比原分辨率匹配快很多，模板太小无法缩小时退化为原分辨率匹配。
+    """
+
+    name = 'pyramid'
+
+    def __init__(self, levels: int = 2, candidates: int = 3, min_size: int = 8, coarse_margin: float = 0.15):
+        """
+        :param levels: 最多缩小的层数，每层缩小一半
+        :param candidates: 粗匹配保留的候选位置个数
+        :param min_size: 缩小后模板的最短边不能小于这个像素
+        :param coarse_margin: 粗匹配的阈值比 confidence 低多少
+        """
+        self.levels = levels
+        self.candidates = candidates
+        self.min_size = min_size
+        self.coarse_margin = coarse_margin
+        self._direct = OpenCVMatcher()
+        self._lock = threading.Lock()
+        self._last_haystack: np.ndarray | None = None
+        self._last_pyramid: list[np.ndarray] = []
+
+    def _level_for(self, needle: np.ndarray) -> int:
+        level = 0
+        short_side = min(needle.shape[:2])
+        while level < self.levels and (short_side >> (level + 1)) >= self.min_size:
+            level += 1
+        return level
+
+    def _pyramid(self, haystack: np.ndarray, level: int) -> np.ndarray:
+        """同一帧匹配多个模板时复用已经缩小过的截图"""
+        with self._lock:
+            if self._last_haystack is not haystack:
+                self._last_haystack = haystack
+                self._last_pyramid = [haystack]
+            pyramid = self._last_pyramid
+            while len(pyramid) <= level:
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+            return pyramid[level]
+
+    def locate(self, haystack, needle, confidence=0.9):
+        level = self._level_for(needle)
+        if level == 0:
+            return self._direct.locate(haystack, needle, confidence)
+
+        scale = 1 << level
+        small_haystack = self._pyramid(haystack, level)
+        small_needle = needle
+        for _ in range(level):
+            small_needle = cv2.pyrDown(small_needle)
+        if small_haystack.shape[0] < small_needle.shape[0] or small_haystack.shape[1] < small_needle.shape[1]:
+            return None
+
+        result = cv2.matchTemplate(small_haystack, small_needle, cv2.TM_CCOEFF_NORMED)
+        needle_h, needle_w = needle.shape[:2]
+        small_h, small_w = small_needle.shape[:2]
+        best_box, best_val = None, confidence
+        for _ in range(self.candidates):
+            _, max_val, _, (x, y) = cv2.minMaxLoc(result)
+            if max_val < confidence - self.coarse_margin:
+                break
+            # 屏蔽该候选周围，下一轮取次优位置
+            result[max(y - small_h // 2, 0):y + small_h // 2 + 1, max(x - small_w // 2, 0):x + small_w // 2 + 1] = -1
+
+            # 回到原分辨率，在候选位置附近精确匹配，缩小时的误差约为一个缩放倍数
+            pad = scale * 2
+            left, top = max(x * scale - pad, 0), max(y * scale - pad, 0)
+            right = min(x * scale + needle_w + pad, haystack.shape[1])
+            bottom = min(y * scale + needle_h + pad, haystack.shape[0])
+            roi = haystack[top:bottom, left:right]
+            if roi.shape[0] < needle_h or roi.shape[1] < needle_w:
+                continue
+            fine = cv2.matchTemplate(roi, needle, cv2.TM_CCOEFF_NORMED)
+            _, fine_val, _, fine_loc = cv2.minMaxLoc(fine)
+            if fine_val >= best_val:
+                best_val = fine_val
+                best_box = Box(left + fine_loc[0], top + fine_loc[1], needle_w, needle_h)
+        return best_box
+
+
+_matchers: dict[str, TemplateMatcher] = {}
+
+def get_matcher(image_key: str | None = None) -> TemplateMatcher:
+    """
+    获取模板使用的匹配引擎，match.engines 中单独配置的优先，其次为 match.engine
+
+    :param image_key: 模板名称，为空时返回全局引擎
+    """
+    match = get_config().match
+    engines = match.get('engines') or {}
+    name = engines.get(image_key) or match.get('engine')
+    if name not in _matchers:
+        if name == PyramidMatcher.name:
+            _matchers[name] = PyramidMatcher(levels=match.get('pyramid_levels'))
+        elif name == OpenCVMatcher.name:
+            _matchers[name] = OpenCVMatcher()
+        else:
+            raise ValueError(f"不支持的匹配引擎: {name}")
+    return _matchers[name]
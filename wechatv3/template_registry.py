@@ -0,0 +1,162 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from wechatv3.common import get_config, ConfigNamespace
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+class TemplateRegistry:
+    """
+    模板图片注册表
+
+    启动时一次性把 paths 中的所有图片解码为 OpenCV 数组（BGR，按需附带灰度），
+    之后所有查找都直接使用内存中的数组，不再每次重新读取、解码 png。
+    可选地使用预编译的 .npz 模板包，冷启动时只读取一个文件。
+    """
+
+    _META_KEY = '__meta__'
+
+    def __init__(self, paths: ConfigNamespace, bundle_path: str = '', grayscale: bool = False):
+        """
+        :param paths: 模板名称 -> 图片路径
+        :param bundle_path: 预编译模板包路径，为空则不使用
+        :param grayscale: 是否在加载时同时生成灰度模板
+        """
+        self.paths = dict(vars(paths))
+        self.bundle_path = bundle_path
+        self.grayscale = grayscale
+        self._color: dict[str, np.ndarray] = {}
+        self._gray: dict[str, np.ndarray] = {}
+
+    def load(self) -> 'TemplateRegistry':
+        """加载全部模板，模板包中过期或缺失的项从图片重新解码，并回写模板包"""
+        loaded = self._load_bundle() if self.bundle_path else set()
+        stale = [key for key in self.paths if key not in loaded]
+        for key in stale:
+            self._load_image(key)
+
+        if self.bundle_path and stale:
+            self.save_bundle(self.bundle_path)
+        logger.info(f"模板已加载: {len(self._color)} 个，其中从模板包读取 {len(loaded)} 个")
+        return self
+
+    def get(self, key: str, grayscale: bool = False) -> np.ndarray:
+        """获取已解码的模板数组"""
+        if key not in self._color:
+            if key not in self.paths:
+                raise KeyError(f"未配置的模板: {key}")
+            self._load_image(key)
+        if not grayscale:
+            return self._color[key]
+        gray = self._gray.get(key)
+        if gray is None:
+            gray = cv2.cvtColor(self._color[key], cv2.COLOR_BGR2GRAY)
+            self._gray[key] = gray
+        return gray
+
+    def keys(self) -> list[str]:
+        return list(self.paths.keys())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.paths
+
+    def _load_image(self, key: str) -> None:
+        path = self.paths[key]
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"模板图片未找到: {key} -> {path}")
+        # cv2.imread 不支持中文路径，先读字节再解码
+        img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"模板图片解码失败: {key} -> {path}")
+        self._color[key] = img
+        self._gray.pop(key, None)
+        if self.grayscale:
+            self._gray[key] = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    def _signature(path: str) -> list | None:
+        """图片文件签名，用于判断模板包中的数据是否过期"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_bundle(self) -> set[str]:
+        """从模板包加载，返回成功加载的模板名称"""
+        if not os.path.exists(self.bundle_path):
+            return set()
+
+        loaded = set()
+        try:
+            with np.load(self.bundle_path, allow_pickle=False) as bundle:
+                meta = json.loads(str(bundle[self._META_KEY]))
+                for key, path in self.paths.items():
+                    entry = meta.get(key)
+                    if entry is None or f'color/{key}' not in bundle:
+                        continue
+                    signature = self._signature(path)
+                    # 图片不存在时信任模板包，图片存在则要求签名一致
+                    if signature is not None and (entry.get('path') != path or entry.get('signature') != signature):
+                        continue
+                    self._color[key] = bundle[f'color/{key}']
+                    if f'gray/{key}' in bundle:
+                        self._gray[key] = bundle[f'gray/{key}']
+                    elif self.grayscale:
+                        self._gray[key] = cv2.cvtColor(self._color[key], cv2.COLOR_BGR2GRAY)
+                    loaded.add(key)
+        except Exception as e:
+            logger.warning(f"读取模板包失败，改为逐个加载图片: {self.bundle_path}, {e}")
+            self._color.clear()
+            self._gray.clear()
+            return set()
+        return loaded
+
+    def save_bundle(self, path: str) -> None:
+        """把当前已加载的模板写成预编译模板包"""
+        arrays = {}
+        meta = {}
+        for key in self.paths:
+            self.get(key)
+            arrays[f'color/{key}'] = self._color[key]
+            if key in self._gray:
+                arrays[f'gray/{key}'] = self._gray[key]
+            meta[key] = {'path': self.paths[key], 'signature': self._signature(self.paths[key])}
+        arrays[self._META_KEY] = np.array(json.dumps(meta, ensure_ascii=False))
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再替换，避免写到一半的模板包被读取
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        logger.info(f"模板包已保存: {path}")
+
+
+# 全局单例实例
+_registry_instance: TemplateRegistry | None = None
+
+def get_template_registry() -> TemplateRegistry:
+    global _registry_instance
+    if _registry_instance is None:
+        config = get_config()
+        _registry_instance = TemplateRegistry(config.paths,
+                                              bundle_path=config.match.get('template_bundle'),
+                                              grayscale=config.match.get('grayscale')).load()
+    return _registry_instance
+
+
+if __name__ == '__main__':
+    # 预编译模板包: python -m wechatv3.template_registry [输出路径]
+    import sys
+
+    output = sys.argv[1] if len(sys.argv) > 1 else (get_config().match.get('template_bundle') or 'imgs/templates.npz')
+    registry = TemplateRegistry(get_config().paths, grayscale=True).load()
+    registry.save_bundle(output)
@@ -0,0 +1,222 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from wechatv3.common import get_config
+from wechatv3.logger_config import LoggerManager
+
+logger = LoggerManager().get_logger()
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    end: float | None = None
+    attrs: dict = field(default_factory=dict)
+    children: list['Span'] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> dict:
+        """origin 为根 span 的开始时间，输出相对开始时间和耗时（毫秒）"""
+        data = {
+            'name': self.name,
+            'offset_ms': round((self.start - origin) * 1000, 1),
+            'duration_ms': round(self.duration * 1000, 1),
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class LatencyHistogram:
+    """按对数分桶的耗时直方图（毫秒），只保存每个桶的计数"""
+
+    # 1ms ~ 约 12 分钟，每个桶是上一个的 √2 倍
+    BOUNDS = [round(2 ** (i / 2), 2) for i in range(40)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        """百分位数，返回所在桶的上界（不超过最大值）"""
+        if self.count == 0:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                return min(self.BOUNDS[index], round(self.max, 1)) if index < len(self.BOUNDS) else round(self.max, 1)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 1) if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max, 1),
+        }
+
+
+class Tracer:
+    """
+    轻量的分段耗时追踪
+
+    span 按线程嵌套，trace 为一次单据处理的根 span，结束时整棵树写入当天的追踪文件；
+    所有 span 的耗时同时按名称汇总到直方图中，用来查看每个步骤的耗时分布。
+    """
+
+    def __init__(self, trace_dir: str = '', summary_every: int = 20):
+        """
+        :param trace_dir: 追踪文件目录，为空则不写文件
+        :param summary_every: 每处理多少个单据输出一次汇总
+        """
+        self.trace_dir = trace_dir
+        self.summary_every = summary_every
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._trace_count = 0
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self) -> Span | None:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """记录一段耗时，嵌套在当前线程正在进行的 span 下"""
+        stack = self._stack()
+        span = Span(name, time.perf_counter(), attrs=attrs)
+        if stack:
+            stack[-1].children.append(span)
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            stack.pop()
+            self.record(name, span.duration * 1000)
+
+    def steps(self) -> 'StepSequence':
+        """顺序执行的多个步骤，见 StepSequence"""
+        return StepSequence(self)
+
+    def record(self, name: str, ms: float) -> None:
+        """直接记录一个耗时到直方图"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(ms)
+
+    @contextmanager
+    def trace(self, invoice_id: str, **attrs):
+        """一次单据处理的根 span，结束后写入追踪记录"""
+        started_at = datetime.now()
+        with self.span('invoice', invoice_id=invoice_id, **attrs) as root:
+            yield root
+        self._write_trace(root, started_at)
+
+        with self._lock:
+            self._trace_count += 1
+            should_summary = self.summary_every and self._trace_count % self.summary_every == 0
+        if should_summary:
+            self.log_summary()
+
+    def _write_trace(self, root: Span, started_at: datetime) -> None:
+        if not self.trace_dir:
+            return
+        record = {'time': started_at.strftime('%Y-%m-%d %H:%M:%S'), **root.to_dict(root.start)}
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            trace_file = os.path.join(self.trace_dir, started_at.strftime('%Y%m%d') + '.jsonl')
+            with open(trace_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.warning(f"写入追踪记录失败: {e}")
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def log_summary(self) -> None:
+        """输出各步骤的耗时分布，并保存到追踪目录"""
+        summary = self.summary()
+        lines = [f"{name}: {item['count']} 次, 平均 {item['avg_ms']}ms, p50 {item['p50_ms']}ms, "
+                 f"p90 {item['p90_ms']}ms, p99 {item['p99_ms']}ms, 最大 {item['max_ms']}ms"
+                 for name, item in summary.items()]
+        logger.info("步骤耗时汇总:\n" + '\n'.join(lines))
+        if not self.trace_dir:
+            return
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            with open(os.path.join(self.trace_dir, 'histogram.json'), 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"保存耗时汇总失败: {e}")
+
+
+class StepSequence:
+    """
+    顺序执行的多个步骤，每次调用 next(name) 结束上一个步骤并开始下一个，
+    适合很长的流程代码，不需要为每个步骤增加一层缩进，结束时调用 close()
+    """
+
+    def __init__(self, tracer: Tracer):
+        self._tracer = tracer
+        self._current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def next(self, name: str, **attrs) -> None:
+        self.close()
+        self._current = self._tracer.span(name, **attrs)
+        self._current.__enter__()
+
+    def close(self) -> None:
+        if self._current is not None:
+            current, self._current = self._current, None
+            current.__exit__(None, None, None)
+
+
+# 全局单例实例
+_tracer_instance: Tracer | None = None
+
+def get_tracer() -> Tracer:
+    global _tracer_instance
+    if _tracer_instance is None:
+        base = get_config().base
+        _tracer_instance = Tracer(base.get('trace_path'), summary_every=base.get('trace_summary_every'))
+    return _tracer_instance
@@ -1,125 +1,155 @@
-import csv
-import os
 import queue
-import re
+import threading
 import time
 from datetime import datetime
 
-from pywinauto import Application
-from wxauto import WeChat
-
+from wechatv3.adaptive_poller import AdaptivePoller
 from wechatv3.common import get_config
+from wechatv3.global_var import ui_lock
 from wechatv3.logger_config import LoggerManager
+from wechatv3.message_rules import ExtractedInvoice, get_message_rules
+from wechatv3.message_source import MessageSource, get_message_source
+from wechatv3.notifier import Notifier
+from wechatv3.invoice_queue import InvoiceQueue, get_invoice_queue
+from wechatv3.processed_index import ProcessedIndex, get_processed_index
+from wechatv3.chat_watermark import ChatWatermarks, get_chat_watermarks
+from wechatv3.tracing import get_tracer
 from .gui_msg import log_message
 
 logger = LoggerManager().get_logger()
 
 class WeChatListener:
-    def __init__(self, msg_queue: queue.Queue):
-        self._wx: WeChat | None = None
+    def __init__(self, msg_queue: queue.Queue, source: MessageSource | None = None,
+                 pending: InvoiceQueue | None = None, processed: ProcessedIndex | None = None,
+                 watermarks: ChatWatermarks | None = None):
+        """
+        :param msg_queue: 待处理单号的内存队列
+        :param source: 消息来源，默认按 base.message_source 创建
+        :param pending: 待处理单据的存储，默认使用配置中的存储
+        :param processed: 已处理单号，默认使用配置中的索引
+        :param watermarks: 每个聊天最后看到的消息，默认使用配置中的文件
+        """
+        self.source = source or get_message_source()
         self.msg_queue = msg_queue
-        self._pattern = re.compile(r"(FHD\d{8})")
-        self.finished_data = WeChatListener._init_finished_data()
+        self.pending = pending if pending is not None else get_invoice_queue()
+        self.rules = get_message_rules()  # 提取单号的规则
+        self.processed = processed if processed is not None else get_processed_index()  # 已处理单号
+        self.watermarks = watermarks if watermarks is not None else get_chat_watermarks()  # 每个聊天最后看到的消息
+        base = get_config().base
+        self.poller = AdaptivePoller(base.get('listen_min_interval'), base.get('listen_max_interval'),
+                                     base.get('listen_backoff'))
+        # 监听和发送通知在不同线程中操作微信界面，用锁避免同时操作
+        self._wx_lock = threading.Lock()
+        self.notifier = Notifier(self._send_now, window=base.get('notify_window'), retries=base.get('notify_retries'),
+                                 retry_delay=base.get('notify_retry_delay'))
         self._init_wechat()
 
     def _init_history_msg(self, who: str, find_str: str):
         log_message(f"开始加载历史单据，关键字: {find_str}")
-        history = []
-        seen = set()
-        if not who or not find_str:
-            return history
+        has_mark = bool(self.watermarks.get(who))
+        if not who or not (has_mark or find_str):
+            return
+
+        self.source.chat_with(who)
 
-        self._wx.ChatWith(who, timeout=30)
+        def _unique(items: list[ExtractedInvoice]) -> list[ExtractedInvoice]:
+            """去掉重复的单号，保留第一次出现的"""
+            seen = set()
+            unique = []
+            for item in items:
+                if item.invoice_id not in seen:
+                    seen.add(item.invoice_id)
+                    unique.append(item)
+            return unique
 
         def _get_history():
+            """
+            向上加载历史消息，直到遇到上次看到的整段消息；没有找到时直到遇到最后处理的单号
+            新加载的消息在列表前面，每页只解析新加载的部分
+            """
             # 限制最多加载的次数，避免死循环
             max_scroll_times = 20
-            scroll_count = 0
+            history = []
+            newest = []
+            parsed = 0
 
-            while scroll_count < max_scroll_times:
+            for scroll_count in range(max_scroll_times):
                 if scroll_count > 0:
-                    self._wx.LoadMoreMessage()
-                in_msgs = self._wx.GetAllMessage()
-
-                for in_msg in reversed(in_msgs):
-                    in_matches = self._pattern.findall(in_msg.content)
-                    for in_match in in_matches:
-                        if find_str == in_match:
-                            logger.info(f"符合的历史单据: {history}")
-                            return history
-                        if in_match not in seen:
-                            seen.add(in_match)
-                            history.append(in_msg)
-
-                scroll_count += 1
-                time.sleep(1)  # 等微信加载
-        for msg in _get_history():
-            matches = self._pattern.findall(msg.content)
-            for match in matches:
-                if match in self.msg_queue:
-                    logger.info(f"匹配到单号: [{match}] 已在待处理，跳过")
-                    continue
-                if match in list(item[0] for item in self.finished_data):
-                    logger.info(f"匹配到单号: [{match}] 单据已处理过，跳过")
-                    continue
-                line = self._add_pending_msg(match, msg)
+                    self.source.load_more()
+                in_msgs = self.source.get_all_messages()
+                if scroll_count > 0 and len(in_msgs) <= parsed:
+                    time.sleep(1)  # 等微信加载
+                    in_msgs = self.source.get_all_messages()
+                    if len(in_msgs) <= parsed:
+                        logger.info(f"没有更早的历史消息: {who}")
+                        break
+                if not newest:
+                    newest = in_msgs[-self.watermarks.FINGERPRINT_SIZE:]
 
-                logger.info(f"已保存 {line.strip()}")
-                log_message(f"已保存 {line.strip()}")
+                # 上次看到的位置可能跨越新旧两页，每次在全部已加载的消息中查找，找到后只取之后的消息
+                end = self.watermarks.locate(who, in_msgs) if has_mark else -1
+                if end >= 0:
+                    history = _unique(self.rules.classify(list(reversed(in_msgs[end + 1:]))))
+                    logger.info(f"符合的历史单据: {[item.invoice_id for item in history]}")
+                    return history, newest
 
-    @staticmethod
-    def _init_finished_data() -> list[any]:
-        # 读取已处理的第一条
-        processed_file = os.path.join(get_config().base.processed_path, get_config().base.processed_file_name)
-        with open(processed_file, 'r', encoding='utf-8-sig') as f:
-            reader = csv.reader(f)
-            next(reader, None)
-            rows = [row for row in reader if row and any(field.strip() for field in row)]
-            return rows
+                # 从新到旧，到最后处理的单号为止
+                page = list(reversed(in_msgs[:len(in_msgs) - parsed]))
+                reached = False
+                for item in self.rules.classify(page):
+                    if find_str and find_str == item.invoice_id:
+                        reached = True
+                        break
+                    history.append(item)
+                history = _unique(history)
+                if reached:
+                    logger.info(f"符合的历史单据: {[item.invoice_id for item in history]}")
+                    return history, newest
+                parsed = len(in_msgs)
+            return history, newest
+
+        history, newest_msgs = _get_history()
+        records = [self._pending_record(item) for item in self._new_invoices(history)]
+
+        # 历史单据一次写入待处理队列，再依次加入内存队列
+        self.pending.append_many(records)
+        for record in records:
+            self.msg_queue.put(record[0])
+            line = ','.join(record)
+            logger.info(f"已保存 {line}")
+            log_message(f"已保存 {line}")
+
+        # 单据写入后再记录位置，中途退出时下次仍会重新加载这些消息
+        if newest_msgs:
+            self.watermarks.set(who, newest_msgs)
+            self.watermarks.save()
 
     # 获取最后处理的单号
     def _get_last_no(self) -> str:
-        # 读取待处理的最后一条
-        pending_file = os.path.join(get_config().base.pending_path, get_config().base.pending_file_name)
-        with open(pending_file, 'r', encoding='utf-8-sig') as f:
-            reader = list(csv.reader(f))
-            # 跳过第一行表头
-            for row in reversed(reader[1:]):
-                if row and row[0].strip():  # 确保这一行存在并且第一个字段不为空
-                    return row[0]
-
-        # 读取已处理的第一条
-        for row in reversed(self.finished_data):
-            if row and row[0].strip():  # 确保这一行存在并且第一个字段不为空
-                return row[0]
-        return ''
+        # 读取待处理队列的最后一条
+        last = self.pending.last()
+        if last is not None:
+            return last[0]
+
+        # 读取最后处理的单号
+        return self.processed.last()
 
     def _init_wechat(self):
         try:
-            if self._wx is None:
-                try:
-                    for name in get_config().wechat_user:
-                        app = Application().connect(title=name)
-                        window = app.window(title=name)
-                        window.close()
-                except Exception:
-                    pass
-                time.sleep(0.5)
-                self._wx = WeChat()
-                self._wx.GetSessionList()
-                last_no = self._get_last_no()
-                logger.info(f"最后处理的单据号: {last_no}")
-                for name in get_config().wechat_user:
-                    self._init_history_msg(name, last_no)
-                log_message("已添加未处理历史消息")
-                self._init_listener()
+            self.source.connect(get_config().wechat_user)
+            last_no = self._get_last_no()
+            logger.info(f"最后处理的单据号: {last_no}")
+            for name in get_config().wechat_user:
+                self._init_history_msg(name, last_no)
+            log_message("已添加未处理历史消息")
+            self._init_listener()
         except Exception as e:
             log_message("初始化微信失败，请确定微信已启动")
             raise e
 
     def _init_listener(self):
         for name in get_config().wechat_user:
-            self._wx.AddListenChat(name)
+            self.source.add_listen_chat(name)
         log_message("微信实例已初始化并添加监听联系人")
 
     def _listen_loop(self):
@@ -137,48 +167,116 @@ class WeChatListener:
             #     log_message("监听微信消息中...")
             #     listening = True  # 已打印，设置为正在监听状态
 
-            msgs = self._wx.GetListenMessage()
-
-            for chat in msgs:
-                for msg in msgs.get(chat, []):
-                    matches = self._pattern.findall(msg.content)
-                    logger.info(f"接收到微信消息: {msg.sender} {msg.content}")
-                    for match in matches:
-                        if match in self.msg_queue:
-                            logger.debug(f"匹配到单号: [{match}] 已在待处理，跳过")
-                            continue
-                        if match in list(item[0] for item in self.finished_data):
-                            logger.debug(f"匹配到单号: [{match}] 单据已处理过，跳过")
-                            continue
-                        line = self._add_pending_msg(match, msg)
-
-                        logger.info(f"已保存 {line.strip()}")
-                        logger.debug(f"待处理单据: {list(self.msg_queue.queue)}")
-                        log_message(f"已保存 {line.strip()}")
-                        log_message(f"剩余待处理单据: {list(self.msg_queue.queue)}")
-            time.sleep(5)
-
-    def _add_pending_msg(self, match, msg) -> str:
-        doc_type = "退货单" if "退货单" in msg.content else "发货单"
+            self.poll_once()
+            self.poller.wait()
+
+    def poll_once(self) -> int:
+        """检查一次新消息，新单号写入待处理，返回收到的消息数"""
+        # 新消息在上一次轮询之后的某个时间到达，入队耗时按最坏情况从上一次轮询结束算起，
+        # 模拟的消息带有产生时间，按实际时间计算
+        previous_poll_at = self.poller.last_poll_at
+        with get_tracer().span('listen.poll'):
+            with self._wx_lock:
+                msgs = self.source.get_listen_messages()
+
+        found = 0
+        for chat in msgs:
+            chat_msgs = msgs.get(chat, [])
+            for msg in chat_msgs:
+                logger.info(f"接收到微信消息: {msg.sender} {msg.content}")
+            for item in self._new_invoices(self.rules.classify(chat_msgs)):
+                line = self._add_pending_msg(item)
+                arrived_at = getattr(item.msg, 'created_at', previous_poll_at)
+                get_tracer().record('listen.enqueue_latency', (time.monotonic() - arrived_at) * 1000)
+
+                logger.info(f"已保存 {line.strip()}")
+                logger.debug(f"待处理单据: {list(self.msg_queue.queue)}")
+                log_message(f"已保存 {line.strip()}")
+                log_message(f"剩余待处理单据: {list(self.msg_queue.queue)}")
+            if chat_msgs:
+                found += len(chat_msgs)
+                self.watermarks.extend(getattr(chat, 'who', chat), chat_msgs)
+        self.watermarks.save()
+        self.poller.polled(found)
+        return found
+
+    def _new_invoices(self, items: list[ExtractedInvoice]) -> list[ExtractedInvoice]:
+        """去掉已在待处理和已处理过的单号"""
+        new_items = []
+        for item in items:
+            if item.invoice_id in self.msg_queue:
+                logger.debug(f"匹配到单号: [{item.invoice_id}] 已在待处理，跳过")
+            elif item.invoice_id in self.processed:
+                logger.debug(f"匹配到单号: [{item.invoice_id}] 单据已处理过，跳过")
+            else:
+                new_items.append(item)
+        return new_items
+
+    @staticmethod
+    def _pending_record(item: ExtractedInvoice) -> list[str]:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        contact = '自己' if msg.sender == 'Self' else msg.sender
-        raw_msg = msg.content.replace('\n', ' ').replace(',', '，').strip()
-        line = f"{match},{doc_type},{timestamp},{contact},{raw_msg}\n"
-        pending_file = os.path.join(get_config().base.pending_path, get_config().base.pending_file_name)
-        with open(pending_file, "a", encoding="utf-8") as f:
-            f.write(line)
-        self.msg_queue.put(match)
-        return line
+        raw_msg = item.msg.content.replace('\n', ' ').replace(',', '，').strip()
+        return [item.invoice_id, item.doc_type, timestamp, item.sender, raw_msg]
+
+    def _add_pending_msg(self, item: ExtractedInvoice) -> str:
+        record = self._pending_record(item)
+        self.pending.append(record)
+        self.msg_queue.put(item.invoice_id)
+        return ','.join(record) + '\n'
 
     def start(self):
         self._listen_loop()
 
     def send_msg(self, content, who):
-        try:
-            self._wx.SendMsg(content, who)
-        except Exception:
-            log_message(f"微信消息发送失败: [{who}]-->{content}")
+        """加入通知队列后立即返回，由后台线程合并发送"""
+        self.notifier.notify(content, who)
 
+    def _send_now(self, content, who):
+        # 发送时会切换到微信窗口并使用剪贴板，等正在处理的单据结束后再发送
+        with ui_lock, self._wx_lock:
+            self.source.send(content, who)
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    # 接收单据的压测，用模拟的消息流代替微信:
+    # python -m wechatv3.wechat_client --rate 600 --duration 30 [--duplicates 0.1] [--multi 0.2] [--script 消息脚本]
+    # 待处理单据、已处理单号和历史消息位置都写在临时目录中，不会影响配置中的存储
+    import argparse
+    import os
+    import tempfile
+    from wechatv3.invoice_queue import SQLiteInvoiceQueue
+    from wechatv3.invoice_record import MessageRecord
+    from wechatv3.message_source import SimulatedSource
+    from wechatv3.msg_unique_queue import DedupQueue
+
+    parser = argparse.ArgumentParser(description='接收单据的吞吐量压测')
+    parser.add_argument('--rate', type=float, default=600, help='每分钟的消息数')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒）')
+    parser.add_argument('--duplicates', type=float, default=0.1, help='重复以前单号的消息比例')
+    parser.add_argument('--multi', type=float, default=0.2, help='包含多个单号的消息比例')
+    parser.add_argument('--script', default='', help='消息脚本，每行 "发送人|内容"')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+    args = parser.parse_args()
+
+    bench_source = SimulatedSource(rate=args.rate, duplicate_ratio=args.duplicates, multi_ratio=args.multi,
+                                   script=args.script, seed=args.seed)
+    bench_dir = tempfile.mkdtemp(prefix='wechat_bench_')
+    MessageRecord.DB_PATH = os.path.join(bench_dir, 'invoice.db')
+    logger.info(f"压测数据目录: {bench_dir}")
+    bench_listener = WeChatListener(DedupQueue(), bench_source, pending=SQLiteInvoiceQueue(),
+                                    processed=ProcessedIndex(os.path.join(bench_dir, 'processed.txt')),
+                                    watermarks=ChatWatermarks(os.path.join(bench_dir, 'watermarks.json')))
+    bench_start = time.monotonic()
+    while time.monotonic() - bench_start < args.duration:
+        bench_listener.poll_once()
+        bench_listener.poller.wait()
+    bench_elapsed = time.monotonic() - bench_start
+
+    bench_summary = get_tracer().summary()
+    latency = bench_summary.get('listen.enqueue_latency', {})
+    poll = bench_summary.get('listen.poll', {})
+    enqueued = latency.get('count', 0)
+    logger.info(f"压测 {bench_elapsed:.1f} 秒: 消息 {bench_source.generated} 条，入队单据 {enqueued} 个，"
+                f"吞吐 {enqueued / bench_elapsed * 60:.0f} 个/分钟")
+    logger.info(f"入队耗时: 平均 {latency.get('avg_ms', 0)}ms, p50 {latency.get('p50_ms', 0)}ms, "
+                f"p90 {latency.get('p90_ms', 0)}ms, p99 {latency.get('p99_ms', 0)}ms, 最大 {latency.get('max_ms', 0)}ms")
+    logger.info(f"检查消息: {poll.get('count', 0)} 次, 平均 {poll.get('avg_ms', 0)}ms, p99 {poll.get('p99_ms', 0)}ms")
\ No newline at end of file
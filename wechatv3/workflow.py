@@ -0,0 +1,243 @@
+import os
+from dataclasses import dataclass, field
+
+import yaml
+
+from wechatv3.common import get_config, AppConfig
+from wechatv3.global_var import global_pause
+from wechatv3.gui_msg import log_message
+from wechatv3.logger_config import LoggerManager
+from wechatv3.tracing import get_tracer
+
+logger = LoggerManager().get_logger()
+
+SUCCESS = 'success'
+FAIL = 'fail'
+
+
+def _is_dropped_input(shown: str, typed: str) -> bool:
+    """shown 是否是 typed 漏掉若干字符后的结果（包括只输入了前面一部分）"""
+    if not shown or len(shown) >= len(typed):
+        return False
+    chars = iter(typed)
+    return all(char in chars for char in shown)
+
+
+@dataclass
+class WorkflowContext:
+    invoice_id: str
+    doc_type: str
+    log: object  # 带单据号的日志
+    hits: dict = field(default_factory=dict)  # 上一个状态检测到的模板 {模板名称: 中心点}
+    safe_input: bool = False  # 下一次 input_invoice_no 使用 safe 节奏
+    safe_retried: bool = False  # 已经用 safe 节奏重新输入过
+    goto: str = ''  # 动作要求跳转的状态，执行完这个动作后直接进入
+
+    def format(self, text: str, **extra) -> str:
+        return text.format(invoice_id=self.invoice_id, doc_type=self.doc_type, **extra)
+
+
+class WorkflowEngine:
+    """
+    根据 workflow.yaml 执行单据处理流程的状态机
+
+    每个状态依次执行: log 输出日志 -> actions 执行动作 -> 以下三者之一
+      result:  结束流程，返回 {status: success/fail, reason: 原因}
+      next:    直接进入下一个状态
+      detect:  在同一帧上一次检测所有候选模板，按 transitions 的顺序选择下一个状态，
+               都没检测到时进入 otherwise
+    retry_safe_input 动作需要重新输入时不再执行之后的动作，直接进入它指定的状态。
+    检测到的模板位置会传给下一个状态，click 动作直接使用，不需要再找一次。
+    文本中的 {invoice_id}、{doc_type} 会被替换为当前单据的值。
+    """
+
+    ACTIONS = ('focus_window', 'input_invoice_no', 'verify_invoice_id', 'retry_safe_input', 'click', 'wait_gone',
+               'notify')
+
+    def __init__(self, definition: dict, worker, max_steps: int = 100):
+        """
+        :param definition: 流程定义
+        :param worker: InvoiceAutomationWorker
+        :param max_steps: 最多执行的状态数，防止配置错误导致死循环
+        """
+        self.start = definition.get('start')
+        self.states: dict[str, dict] = definition.get('states') or {}
+        self.worker = worker
+        self.max_steps = max_steps
+        self._validate()
+
+    @classmethod
+    def load(cls, path: str, worker) -> 'WorkflowEngine':
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"流程配置文件未找到: {path}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(yaml.safe_load(f), worker)
+
+    def _validate(self) -> None:
+        if self.start not in self.states:
+            raise ValueError(f"流程的开始状态不存在: {self.start}")
+        for name, state in self.states.items():
+            endings = [key for key in ('result', 'next', 'detect') if key in state]
+            if len(endings) != 1:
+                raise ValueError(f"状态 [{name}] 必须且只能配置 result、next、detect 其中之一")
+            targets = [state.get('next')] if 'next' in state else []
+            if 'detect' in state:
+                templates = state['detect'].get('templates') or []
+                transitions = state.get('transitions') or {}
+                unknown = [key for key in templates if key not in self.worker.templates]
+                if unknown:
+                    raise ValueError(f"状态 [{name}] 检测了未配置的模板: {unknown}")
+                if not set(transitions) <= set(templates):
+                    raise ValueError(f"状态 [{name}] 的 transitions 只能使用 detect 中的模板")
+                targets += list(transitions.values()) + [state.get('otherwise')]
+            for target in targets:
+                if target not in self.states:
+                    raise ValueError(f"状态 [{name}] 指向了不存在的状态: {target}")
+            for action in state.get('actions') or []:
+                action_name, arg, _ = self._parse_action(action)
+                if action_name not in self.ACTIONS:
+                    raise ValueError(f"状态 [{name}] 使用了不支持的动作: {action_name}")
+                if action_name == 'retry_safe_input' and arg not in self.states:
+                    raise ValueError(f"状态 [{name}] 的 retry_safe_input 指向了不存在的状态: {arg}")
+
+    @staticmethod
+    def _parse_action(action) -> tuple[str, object, dict]:
+        """动作可以写成 名称 或者 {名称: 参数, 其他选项...}"""
+        if isinstance(action, str):
+            return action, None, {}
+        options = dict(action)
+        for name in WorkflowEngine.ACTIONS:
+            if name in options:
+                return name, options.pop(name), options
+        return next(iter(options), ''), None, options
+
+    def run(self, invoice_id: str, doc_type: str, log) -> tuple[str, str]:
+        """
+        执行流程
+
+        :return: (success/fail, 原因)
+        """
+        ctx = WorkflowContext(invoice_id, doc_type, log)
+        state_name = self.start
+        pending_hits: dict = {}
+        with get_tracer().steps() as step:
+            for _ in range(self.max_steps):
+                global_pause.wait()
+                step.next(state_name)
+                state = self.states[state_name]
+                # 检测结果只对紧接着的状态有效，之后界面可能已经变化
+                ctx.hits, pending_hits = pending_hits, {}
+
+                if state.get('log'):
+                    message = ctx.format(state['log'])
+                    log.info(message)
+                    log_message(f"[{invoice_id}] {message}")
+
+                for action in state.get('actions') or []:
+                    outcome = self._run_action(action, ctx)
+                    if outcome is not None:
+                        return outcome
+                    if ctx.goto:
+                        break
+                if ctx.goto:
+                    state_name, ctx.goto = ctx.goto, ''
+                    continue
+
+                if 'result' in state:
+                    result = state['result'] or {}
+                    return result.get('status', SUCCESS), ctx.format(result.get('reason') or '')
+                if 'next' in state:
+                    state_name = state['next']
+                    continue
+
+                state_name, pending_hits = self._detect(state, ctx)
+        raise RuntimeError(f"流程执行超过 {self.max_steps} 个状态，请检查流程配置")
+
+    def _detect(self, state: dict, ctx: WorkflowContext) -> tuple[str, dict]:
+        detect = state['detect']
+        templates = detect['templates']
+        transitions = state.get('transitions') or {}
+        # 只有 transitions 中的模板出现才结束等待，其余模板只是顺便记录位置
+        hits = self.worker.wait_for_any(templates, timeout=detect.get('timeout', 0),
+                                        confidence=detect.get('confidence', 0.9),
+                                        required=list(transitions),
+                                        first_hit=detect.get('first_hit', False))
+        ctx.log.info(f"检测 {templates}，找到: {hits}")
+        for key, target in transitions.items():
+            if key in hits:
+                return target, hits
+        return state['otherwise'], hits
+
+    def _run_action(self, action, ctx: WorkflowContext) -> tuple[str, str] | None:
+        name, arg, options = self._parse_action(action)
+        worker = self.worker
+        global_pause.wait()
+
+        if name == 'focus_window':
+            worker.bring_window_to_front()
+        elif name == 'input_invoice_no':
+            worker.input_invoice_no(ctx.invoice_id, safe=ctx.safe_input)
+            ctx.safe_input = False
+        elif name == 'retry_safe_input':
+            # 快速输入漏了字符时多半搜索不到单据，非 safe 节奏下用 safe 节奏从 arg 状态重新输入一次
+            if not ctx.safe_retried and not worker.input.is_safe('input_invoice_no'):
+                ctx.log.info(f'使用 safe 节奏重新输入单号: {ctx.invoice_id}')
+                ctx.safe_input = ctx.safe_retried = True
+                ctx.goto = arg
+        elif name == 'verify_invoice_id':
+            valid, invoice_no = worker.valid_invoice_id(ctx.invoice_id)
+            # safe 节奏重新输入后找到了单据，说明之前漏了字符，之后这个步骤都使用 safe 节奏
+            if valid and ctx.safe_retried:
+                worker.input.degrade('input_invoice_no')
+            # 搜索到的单号是少了字符的输入时，可能是快速输入漏了字符，改用 safe 节奏重新输入一次；
+            # 其余的不一致是真的搜索到了别的单据，不改变输入节奏
+            if not valid and _is_dropped_input(invoice_no, ctx.invoice_id) \
+                    and worker.input.degrade('input_invoice_no'):
+                ctx.log.info(f'单号不一致，搜索到的: {invoice_no}，使用 safe 节奏重新输入')
+                worker.input_invoice_no(ctx.invoice_id)
+                valid, invoice_no = worker.valid_invoice_id(ctx.invoice_id)
+            if not valid:
+                msg = f'单号不一致，搜索到的: {invoice_no} 需要的: {ctx.invoice_id}'
+                ctx.log.info(msg)
+                log_message(msg)
+                return FAIL, msg
+        elif name == 'click':
+            return self._click(arg, options, ctx)
+        elif name == 'wait_gone':
+            timeout = options.get('timeout', get_config().match.get('print_timeout'))
+            if not worker.wait_until_gone(arg, timeout=timeout):
+                return FAIL, ctx.format(options.get('fail') or '{image_key} 超过 {timeout} 秒未消失',
+                                        image_key=arg, timeout=timeout)
+        elif name == 'notify':
+            worker.wechat_client.send_msg(ctx.format(arg), get_config().base.notify_user)
+        return None
+
+    def _click(self, image_key: str, options: dict, ctx: WorkflowContext) -> tuple[str, str] | None:
+        """
+        点击模板，优先使用上一个状态检测到的位置
+
+        options: offset: [x, y] 偏移，timeout: 找不到时等待的秒数，move: 移动鼠标的时长（fast 节奏下不移动），
+                 optional: 找不到时跳过，fail: 找不到时的失败原因
+        """
+        location = ctx.hits.get(image_key)
+        if location is None:
+            location = self.worker.wait_until_appears(image_key, timeout=options.get('timeout', 2.5),
+                                                      confidence=options.get('confidence', 0.9))
+        if location is None:
+            if options.get('optional'):
+                return None
+            msg = ctx.format(options.get('fail') or f'没找到 {image_key}')
+            ctx.log.info(msg)
+            log_message(f"[{ctx.invoice_id}] {msg}")
+            return FAIL, msg
+
+        offset_x, offset_y = options.get('offset') or (0, 0)
+        x, y = location.x + offset_x, location.y + offset_y
+        self.worker.input.click(x, y, step=f'click.{image_key}', move=options.get('move', 0))
+        ctx.log.info(f"点击 {image_key}: {x}, {y}")
+        return None
+
+
+def get_workflow_path() -> str:
+    path = get_config().base.get('workflow')
+    return path if os.path.isabs(path) else os.path.join(AppConfig.base_dir, path)